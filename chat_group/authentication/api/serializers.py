@@ -3,7 +3,8 @@ from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainSerializer
 from rest_framework_simplejwt.settings import api_settings
-from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.tokens import SessionRefreshToken
 
 
 User = get_user_model()
@@ -12,7 +13,7 @@ User = get_user_model()
 class LoginTokenCreateSerializer(TokenObtainSerializer):
     @classmethod
     def get_token(cls, user):
-        return RefreshToken.for_user(user)
+        return SessionRefreshToken.for_user(user)
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -32,9 +33,9 @@ class LoginTokenRefreshSerializer(serializers.Serializer):
     access_token = serializers.CharField(read_only=True)
 
     def validate(self, attrs):
-        refresh = RefreshToken(attrs["refresh_token"])
+        refresh = SessionRefreshToken(attrs["refresh_token"])
 
-        data = {"access_token": str(refresh.access_token)}
+        data = {}
 
         if api_settings.ROTATE_REFRESH_TOKENS:
             if api_settings.BLACKLIST_AFTER_ROTATION:
@@ -51,6 +52,8 @@ class LoginTokenRefreshSerializer(serializers.Serializer):
             refresh.set_iat()
 
             data["refresh_token"] = str(refresh)
+        # minted after rotation, so it is not revoked with the old refresh jti
+        data["access_token"] = str(refresh.access_token)
         data["refresh_expires_in"] = int(refresh.lifetime.total_seconds())
         data["access_expires_in"] = int(refresh.access_token.lifetime.total_seconds())
         data["token_type"] = "bearer"
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from authentication.directory import search_users
+from chats.pagination import get_page_size
 from .serializers import (
     LoginTokenCreateSerializer,
     LoginTokenRefreshSerializer,
@@ -30,6 +34,56 @@ class UserViewSet(viewsets.ModelViewSet):
         if self.request.method.lower() == "patch":
             return UpdateUserSerializer
 
+    def list(self, request, *args, **kwargs):
+        usernames = request.query_params.get("usernames")
+        if usernames is not None:
+            return self.lookup(request, usernames)
+        limit = get_page_size(
+            request,
+            default=settings.USERS_PAGE_SIZE,
+            maximum=settings.USERS_MAX_PAGE_SIZE,
+        )
+        after = request.query_params.get("after")
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                raise ValidationError("after must be a user id.")
+        search = request.query_params.get("search", "").strip()
+        if search:
+            users = search_users(self.get_queryset(), search, after=after)
+        else:
+            users = self.get_queryset().order_by("id")
+            if after is not None:
+                users = users.filter(id__gt=after)
+        page = list(users[: limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        response = {
+            "users": GetUserSerializer(page, many=True).data,
+            "next": page[-1].pk if has_more else None,
+        }
+        return Response(data=response, status=status.HTTP_200_OK)
+
+    def lookup(self, request, usernames):
+        """Resolve ``?usernames=a,b,c`` with one query, in request order."""
+        usernames = list(dict.fromkeys(name for name in usernames.split(",") if name))
+        if len(usernames) > settings.USERS_LOOKUP_MAX:
+            raise ValidationError(
+                f"At most {settings.USERS_LOOKUP_MAX} usernames can be looked up."
+            )
+        users = {
+            user.username: user
+            for user in self.get_queryset().filter(username__in=usernames)
+        }
+        response = {
+            "users": GetUserSerializer(
+                [users[name] for name in usernames if name in users], many=True
+            ).data,
+            "missing": [name for name in usernames if name not in users],
+        }
+        return Response(data=response, status=status.HTTP_200_OK)
+
     def create(self, request, *args, **kwargs):
         data = request.data
         if not request.user.is_superuser:
@@ -60,6 +114,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
 class LoginTokenCreateView(TokenObtainPairView):
     serializer_class = LoginTokenCreateSerializer
+    throttle_scope = "login"
 
 
 class LoginTokenRefreshView(TokenRefreshView):
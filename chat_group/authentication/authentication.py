@@ -0,0 +1,105 @@
+import copy
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from authentication.tokens import REFRESH_JTI_CLAIM
+from chat_group.caching import LocalTTLCache
+from chats.pubsub import get_broker
+
+INVALIDATION_CHANNEL = "authentication.users"
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication serving users from a short lived per-process cache.
+
+    The token signature and expiry are still verified on every request, only
+    the user lookup (and the blacklist check) is skipped while the
+    ``(user id, refresh jti)`` pair is cached. ``authentication.signals`` drops
+    the entries when the user changes or the refresh token gets blacklisted,
+    in every process subscribed to the ``CHAT_PUBSUB`` broker. Access tokens
+    minted without a ``refresh_jti`` claim stay valid until they expire.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        refresh_jti = validated_token.get(REFRESH_JTI_CLAIM)
+        key = (str(user_id), refresh_jti or validated_token.get(api_settings.JTI_CLAIM))
+        user_cache = get_user_cache()
+        user = user_cache.get(key)
+        if user is None:
+            if refresh_jti and is_blacklisted(refresh_jti):
+                raise InvalidToken("Token is blacklisted")
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+        # requests must not share (and mutate) one cached instance
+        return copy.copy(user)
+
+
+def is_blacklisted(jti):
+    if not apps.is_installed("rest_framework_simplejwt.token_blacklist"):
+        return False
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def invalidate_user(user_id):
+    _broadcast({"type": "user.invalidated", "user": str(user_id)})
+
+
+def invalidate_token(jti):
+    _broadcast({"type": "token.invalidated", "jti": jti})
+
+
+def _broadcast(event):
+    _drop_cached(event)
+    get_broker().publish(INVALIDATION_CHANNEL, event)
+
+
+def _drop_cached(event):
+    if event["type"] == "user.invalidated":
+        get_user_cache().delete_where(lambda key: key[0] == event["user"])
+    else:
+        get_user_cache().delete_where(lambda key: key[1] == event["jti"])
+
+
+_user_cache = None
+_user_cache_subscription = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache, _user_cache_subscription
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = settings.JWT_USER_CACHE
+                _user_cache = LocalTTLCache(
+                    max_entries=config.get("MAX_ENTRIES", 10000),
+                    ttl=config.get("TTL", 30),
+                )
+                _user_cache_subscription = get_broker().subscribe(
+                    [INVALIDATION_CHANNEL], _drop_cached
+                )
+    return _user_cache
+
+
+@receiver(setting_changed)
+def reset_user_cache(*, setting, **kwargs):
+    global _user_cache, _user_cache_subscription
+    # a new broker needs a new subscription as well
+    if setting not in ("JWT_USER_CACHE", "CHAT_PUBSUB"):
+        return
+    if _user_cache_subscription is not None:
+        _user_cache_subscription.close()
+    _user_cache = _user_cache_subscription = None
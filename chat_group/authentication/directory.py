@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+
+User = get_user_model()
+
+SEARCH_FIELDS = ("username", "first_name", "last_name")
+
+
+def index_name(field):
+    return f"auth_user_{field}_lower_idx"
+
+
+def install_directory_indexes(schema_editor):
+    """Index ``LOWER(field)`` of the searchable user columns.
+
+    Like any index created outside of the model state, sqlite loses these
+    when a migration rebuilds ``auth_user``, such a migration has to call this
+    again. SQL ``LOWER()`` only agrees with ``str.lower()`` for ASCII input,
+    sqlite folds no other characters and other databases follow their
+    collation, so non-ASCII prefixes may match case sensitively or not at
+    all.
+    """
+    vendor = schema_editor.connection.vendor
+    table = schema_editor.quote_name(User._meta.db_table)
+    for field in SEARCH_FIELDS:
+        column = schema_editor.quote_name(User._meta.get_field(field).column)
+        if vendor == "mysql":
+            # functional key parts need their own parentheses
+            expression = f"((LOWER({column})))"
+        elif vendor in ("sqlite", "postgresql"):
+            expression = f"(LOWER({column}))"
+        else:
+            continue
+        schema_editor.execute(
+            f"CREATE INDEX {index_name(field)} ON {table} {expression}"
+        )
+
+
+def remove_directory_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    table = schema_editor.quote_name(User._meta.db_table)
+    for field in SEARCH_FIELDS:
+        if vendor == "mysql":
+            schema_editor.execute(f"DROP INDEX {index_name(field)} ON {table}")
+        elif vendor in ("sqlite", "postgresql"):
+            schema_editor.execute(f"DROP INDEX IF EXISTS {index_name(field)}")
+
+
+def search_users(queryset, prefix, after=None):
+    """Users whose username, first or last name starts with ``prefix``, case
+    insensitive, ordered by id and past the ``after`` id.
+
+    Each name is matched as a range on its lowercased index, the id cursor
+    is compared as ``id + 0`` so limited pages stay on those indexes instead of
+    walking the primary key.
+    """
+    # must agree with the database's LOWER(), only guaranteed for ASCII
+    prefix = prefix.lower()
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        queryset = queryset.alias(**{f"{field}_lower": Lower(field)})
+        condition |= Q(**{f"{field}_lower__gte": prefix, f"{field}_lower__lt": upper})
+    queryset = queryset.filter(condition)
+    if after is not None:
+        queryset = queryset.alias(cursor=F("id") + 0).filter(cursor__gt=after)
+    return queryset.order_by("id")
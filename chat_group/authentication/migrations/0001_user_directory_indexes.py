@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from authentication.directory import (
+    install_directory_indexes,
+    remove_directory_indexes,
+)
+
+
+# Raw LOWER() expression indexes, see install_directory_indexes. LOWER() and
+# str.lower() used on the search prefix differ for non-ASCII input.
+def install(apps, schema_editor):
+    install_directory_indexes(schema_editor)
+
+
+def remove(apps, schema_editor):
+    remove_directory_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
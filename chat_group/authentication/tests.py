@@ -1,3 +1,128 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from model_mommy import mommy
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.authentication import INVALIDATION_CHANNEL, get_user_cache
+from authentication.directory import search_users
+from chat_group.throttling import get_throttling
+from chats.chat_client import logged_in_client, make_user
+from chats.pubsub import get_broker
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        get_throttling().store.clear()
+        self.superuser = make_user("dev", is_superuser=True)
+        self.client = logged_in_client("dev")
+
+    def test_user_served_from_cache(self):
+        self.client.get_user("dev")
+        with self.assertNumQueries(1):
+            # only the user row requested by the view itself
+            response = self.client.get_user("dev")
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_invalidates_cached_user(self):
+        self.client.get_user("dev")
+        self.assertEqual(len(get_user_cache()), 1)
+        response = self.client.update_user("dev", "Renamed")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(get_user_cache()), 0)
+
+    def test_invalidation_from_other_process(self):
+        self.client.get_user("dev")
+        self.assertEqual(len(get_user_cache()), 1)
+        get_broker().publish(
+            INVALIDATION_CHANNEL,
+            {"type": "user.invalidated", "user": str(self.superuser.pk)},
+        )
+        self.assertEqual(len(get_user_cache()), 0)
+
+    def test_blacklisted_token_is_rejected(self):
+        tokens = self.client.client.post(
+            "/api/v1/login/", data={"username": "dev", "password": "dev"}
+        ).json()
+        self.client.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {tokens['access_token']}"
+        )
+        self.assertEqual(self.client.get_user("dev").status_code, 200)
+        RefreshToken(tokens["refresh_token"]).blacklist()
+        self.assertEqual(self.client.get_user("dev").status_code, 401)
+        # other sessions of the user are not affected
+        self.assertEqual(logged_in_client("dev").get_user("dev").status_code, 200)
+
+    def test_refreshed_access_token_is_rejected_with_its_refresh_token(self):
+        tokens = self.client.client.post(
+            "/api/v1/login/", data={"username": "dev", "password": "dev"}
+        ).json()
+        access = self.client.client.post(
+            "/api/v1/token/", data={"refresh_token": tokens["refresh_token"]}
+        ).json()["access_token"]
+        self.client.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(self.client.get_user("dev").status_code, 200)
+        RefreshToken(tokens["refresh_token"]).blacklist()
+        self.assertEqual(self.client.get_user("dev").status_code, 401)
+
+
+class UserDirectoryTestCase(APITestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        get_throttling().store.clear()
+        self.superuser = make_user("dev", is_superuser=True)
+        mommy.make(User, username="alice", first_name="Alice", last_name="Moss")
+        mommy.make(User, username="bob", first_name="Robert", last_name="Allen")
+        mommy.make(User, username="carol", first_name="Carol", last_name="Smith")
+        self.client = logged_in_client("dev")
+
+    def test_pages_follow_next(self):
+        usernames = []
+        after = None
+        while True:
+            params = {"limit": 2}
+            if after is not None:
+                params["after"] = after
+            response = self.client.get_users(**params)
+            self.assertEqual(response.status_code, 200)
+            usernames += [user["username"] for user in response.json()["users"]]
+            after = response.json()["next"]
+            if after is None:
+                break
+        self.assertEqual(usernames, ["dev", "alice", "bob", "carol"])
+
+    def test_search_matches_name_prefixes(self):
+        response = self.client.get_users(search="AL")
+        usernames = [user["username"] for user in response.json()["users"]]
+        # alice by username and first name, bob by last name
+        self.assertEqual(usernames, ["alice", "bob"])
+        response = self.client.get_users(search="al", limit=1)
+        self.assertEqual(response.json()["next"], User.objects.get(username="alice").pk)
+        response = self.client.get_users(search="al", after=response.json()["next"])
+        self.assertEqual(
+            [user["username"] for user in response.json()["users"]], ["bob"]
+        )
+
+    def test_batch_lookup_is_one_query(self):
+        self.client.get_user("dev")
+        with self.assertNumQueries(1):
+            response = self.client.lookup_users(["carol", "ghost", "alice"])
+        self.assertEqual(
+            [user["username"] for user in response.json()["users"]], ["carol", "alice"]
+        )
+        self.assertEqual(response.json()["missing"], ["ghost"])
+
+    @skipUnless(connection.vendor == "sqlite", "plan check is sqlite specific")
+    def test_search_uses_prefix_indexes(self):
+        # pages are always sliced, without a limit the id order wins
+        page = search_users(User.objects.all(), "al", after=1)[:10]
+        sql, params = page.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("auth_user_username_lower_idx", plan)
@@ -0,0 +1,17 @@
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+REFRESH_JTI_CLAIM = "refresh_jti"
+
+
+class SessionRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry its ``jti``, so blacklisting
+    the refresh token revokes them as well."""
+
+    no_copy_claims = RefreshToken.no_copy_claims + (REFRESH_JTI_CLAIM,)
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        access[REFRESH_JTI_CLAIM] = self[api_settings.JTI_CLAIM]
+        return access
@@ -2,6 +2,11 @@
 ASGI config for chat_group project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django, websocket connections on
+``/ws/v1/chatgroups/`` receive real-time events of the user's groups and
+message history requests with ``?wait=`` are long-polls answered without
+holding a thread. Streaming bodies, such as exports, are read in a worker
+thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +14,23 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chat_group.settings")
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from chat_group.streaming import StreamingASGIHandler  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+from chats.longpoll import is_long_poll, long_poll_application  # noqa: E402
+from chats.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await websocket_application(scope, receive, send)
+    if is_long_poll(scope):
+        return await long_poll_application(scope, receive, send)
+    return await django_application(scope, receive, send)
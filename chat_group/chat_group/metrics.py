@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` counting statements and time spent."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - start
+
+
+@contextmanager
+def counting_queries(counter):
+    """Count the statements of every configured database into ``counter``."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+class _RouteStats:
+    __slots__ = ("buckets", "count", "seconds", "queries", "sql_seconds", "bytes")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.bytes = 0
+
+
+class MetricsRegistry:
+    """Per route request metrics, rendered in the Prometheus text format.
+
+    Labels are the resolved URL name, a fixed set of methods and the status
+    class, so the number of series is bounded by the URL conf.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, route, method, status, seconds, queries, sql_seconds, size):
+        labels = _label_values(route, method, status)
+        with self._lock:
+            stats = self._stats.get(labels)
+            if stats is None:
+                stats = self._stats[labels] = _RouteStats()
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.queries += queries
+            stats.sql_seconds += sql_seconds
+            stats.bytes += size
+
+    def add_bytes(self, route, method, status, size):
+        labels = _label_values(route, method, status)
+        with self._lock:
+            stats = self._stats.get(labels)
+            if stats is not None:
+                stats.bytes += size
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def render(self):
+        with self._lock:
+            snapshot = [
+                (
+                    labels,
+                    stats.buckets[:],
+                    stats.count,
+                    stats.seconds,
+                    stats.queries,
+                    stats.sql_seconds,
+                    stats.bytes,
+                )
+                for labels, stats in sorted(self._stats.items())
+            ]
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for labels, buckets, count, seconds, *_ in snapshot:
+            label = _labels(labels)
+            cumulative = 0
+            for bound, observed in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += observed
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"http_request_duration_seconds_sum{{{label}}} {seconds}")
+            lines.append(f"http_request_duration_seconds_count{{{label}}} {count}")
+        for name, index, help_text in (
+            ("http_requests_total", 2, "Requests by route."),
+            ("http_request_sql_queries_total", 4, "SQL statements run by route."),
+            ("http_request_sql_seconds_total", 5, "Time spent in SQL by route."),
+            ("http_response_bytes_total", 6, "Response body bytes by route."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for row in snapshot:
+                lines.append(f"{name}{{{_labels(row[0])}}} {row[index]}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_values(route, method, status):
+    return route, method if method in METHODS else "OTHER", f"{status // 100}xx"
+
+
+def _labels(labels):
+    route, method, status = labels
+    return f'route="{route}",method="{method}",status="{status}"'
+
+
+registry = MetricsRegistry()
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route or "unnamed"
+
+
+class MetricsMiddleware:
+    """Records latency, SQL statements and time and response size of every
+    request into ``registry``. SQL is counted by an execute wrapper on each
+    configured database for the duration of the request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with counting_queries(counter):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        route, method = route_name(request), request.method
+        if response.streaming:
+            size = 0
+            response.streaming_content = self._count_bytes(
+                response.streaming_content, route, method, response.status_code
+            )
+        else:
+            size = len(response.content)
+        registry.observe(
+            route,
+            method,
+            response.status_code,
+            elapsed,
+            counter.queries,
+            counter.seconds,
+            size,
+        )
+        return response
+
+    def _count_bytes(self, chunks, route, method, status):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.add_bytes(route, method, status, size)
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,155 @@
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+from chat_group.caching import LocalTTLCache
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_current_request = ContextVar("chat_db_request", default=None)
+
+
+def request_user_id(request):
+    """Id of the user the request is authenticated as, without forcing the
+    lazy session user, which would route its own query back through here."""
+    user = request.__dict__.get("user")
+    if isinstance(user, LazyObject):
+        user = user._wrapped
+        if user is empty:
+            return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class WritePins:
+    """Remembers who wrote recently so their reads stay on the primary.
+
+    Pins are kept per user id and per client address, the latter covers
+    anonymous writes such as signing up and logging in.
+    """
+
+    key_prefix = "chat_group:db_pin:"
+
+    def __init__(self, sticky_seconds=5, max_entries=100000, shared_cache=None):
+        self.sticky_seconds = sticky_seconds
+        self.local = LocalTTLCache(max_entries=max_entries, ttl=sticky_seconds)
+        self.shared = caches[shared_cache] if shared_cache else None
+
+    def _keys(self, request):
+        keys = []
+        user_id = request_user_id(request)
+        if user_id is not None:
+            keys.append(f"{self.key_prefix}user:{user_id}")
+        address = request.META.get("REMOTE_ADDR")
+        if address:
+            keys.append(f"{self.key_prefix}ip:{address}")
+        return keys
+
+    def pin(self, request):
+        keys = self._keys(request)
+        for key in keys:
+            self.local.set(key, True)
+        if self.shared is not None and keys:
+            self.shared.set_many(dict.fromkeys(keys, True), self.sticky_seconds)
+
+    def is_pinned(self, request):
+        keys = self._keys(request)
+        if any(self.local.get(key) for key in keys):
+            return True
+        if self.shared is not None and keys:
+            return bool(self.shared.get_many(keys))
+        return False
+
+
+_write_pins = None
+_write_pins_lock = threading.Lock()
+
+
+def get_write_pins():
+    global _write_pins
+    if _write_pins is None:
+        with _write_pins_lock:
+            if _write_pins is None:
+                config = settings.CHAT_READ_YOUR_WRITES
+                _write_pins = WritePins(
+                    sticky_seconds=config.get("STICKY_SECONDS", 5),
+                    max_entries=config.get("MAX_ENTRIES", 100000),
+                    shared_cache=config.get("SHARED_CACHE"),
+                )
+    return _write_pins
+
+
+@receiver(setting_changed)
+def reset_write_pins(*, setting, **kwargs):
+    global _write_pins
+    if setting == "CHAT_READ_YOUR_WRITES":
+        _write_pins = None
+
+
+class PrimaryReplicaRouter:
+    """Sends reads of safe requests to one of ``settings.DATABASE_REPLICAS``
+    and everything else, including work outside of a request, to the primary.
+
+    Clients pinned by ``WritePins`` read from the primary. Once the request
+    is authenticated the choice is kept for the rest of it, so all its reads
+    see one database.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        request = _current_request.get()
+        if not replicas or request is None or request.method not in SAFE_METHODS:
+            return DEFAULT_DB_ALIAS
+        alias = request.__dict__.get("_db_read_alias")
+        if alias is not None:
+            return alias
+        if get_write_pins().is_pinned(request):
+            alias = DEFAULT_DB_ALIAS
+        else:
+            alias = random.choice(replicas)
+        if request_user_id(request) is not None:
+            request._db_read_alias = alias
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
+
+
+@contextmanager
+def bind_request(request):
+    """Route the reads made inside the block as reads of ``request``."""
+    token = _current_request.set(request)
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+class ReadYourWritesMiddleware:
+    """Exposes the request to ``PrimaryReplicaRouter`` and pins the client to
+    the primary after every write request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with bind_request(request):
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            get_write_pins().pin(request)
+        return response
@@ -46,7 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "chat_group.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "chat_group.routers.ReadYourWritesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -86,6 +88,38 @@ DATABASES = {
     }
 }
 
+# Aliases of DATABASES serving the reads of GET requests, e.g. a second sqlite
+# file to try it locally:
+# DATABASES["replica"] = {
+#     "ENGINE": "django.db.backends.sqlite3",
+#     "NAME": BASE_DIR / "db.replica.sqlite3",
+# }
+# DATABASE_REPLICAS = ["replica"]
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = [
+    "chats.sharding.ShardRouter",
+    "chat_group.routers.PrimaryReplicaRouter",
+]
+
+# Aliases of DATABASES holding the chat groups, placed by a hash of their id,
+# with their messages and reactions. Empty keeps everything on the default
+# database, which always holds the users and the group placements. Group
+# placements are cached per process for TTL seconds.
+CHAT_SHARDING = {
+    "SHARDS": [],
+    "MAX_ENTRIES": 100000,
+    "TTL": 60,
+}
+
+# Clients keep reading from the primary for STICKY_SECONDS after a write so
+# they see their own changes despite replication lag. SHARED_CACHE names an
+# alias of CACHES to share the pins between processes.
+CHAT_READ_YOUR_WRITES = {
+    "STICKY_SECONDS": 5,
+    "MAX_ENTRIES": 100000,
+    "SHARED_CACHE": None,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -128,8 +162,114 @@ STATIC_URL = "static/"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.authentication.CachedJWTAuthentication",
+    ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "chats.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    "DEFAULT_THROTTLE_CLASSES": ("chat_group.throttling.TokenBucketThrottle",),
+}
+
+# Users resolved from JWTs are cached per (user id, token jti) for TTL seconds,
+# changes and blacklisted tokens are dropped in every process via CHAT_PUBSUB
+JWT_USER_CACHE = {
+    "MAX_ENTRIES": 10000,
+    "TTL": 30,
 }
 
 DEFAULT_PASS = "P@ssw0rd"
+
+# Message history pagination
+CHAT_MESSAGES_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
+CHAT_MEMBERS_PAGE_SIZE = 100
+CHAT_MEMBERS_MAX_PAGE_SIZE = 1000
+
+# User directory pagination and ``?usernames=`` batch lookup limits
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 1000
+USERS_LOOKUP_MAX = 500
+
+# Upper bound of ``?wait=`` seconds a long-poll for new messages is held open
+CHAT_LONG_POLL_MAX_WAIT = 25
+
+# Unread counts above this are reported as "<cap>+"
+CHAT_UNREAD_CAP = 99
+
+# Bulk message ingest limits
+CHAT_BULK_MAX_MESSAGES = 10000
+CHAT_BULK_CHUNK_SIZE = 1000
+
+# Reactions accepted by one ``POST /messages/reactions`` request
+CHAT_REACTIONS_BATCH_MAX = 500
+
+# Rows fetched per round trip while streaming history exports
+CHAT_EXPORT_CHUNK_SIZE = 2000
+
+# ``manage.py archive_messages`` moves messages older than this many days into
+# compressed per group segments covering CHAT_ARCHIVE_WINDOW_HOURS each.
+# Archived messages are no longer found by message search.
+CHAT_ARCHIVE_AFTER_DAYS = 90
+CHAT_ARCHIVE_WINDOW_HOURS = 24
+
+# Per-process cache of group member ids, SHARED_CACHE names an alias of
+# CACHES used as a second tier shared between processes. Invalidations reach
+# the other processes through the CHAT_PUBSUB broker.
+CHAT_MEMBERSHIP_CACHE = {
+    "MAX_ENTRIES": 10000,
+    "TTL": 60,
+    "SHARED_CACHE": None,
+}
+
+# Real-time fan-out of group events. Use ``chats.pubsub.RedisBroker`` with
+# ``{"url": "redis://..."}`` as OPTIONS when running more than one node.
+CHAT_PUBSUB = {
+    "BACKEND": "chats.pubsub.InProcessBroker",
+    "OPTIONS": {},
+}
+
+# Responses of message creation remembered per ``Idempotency-Key`` header so
+# client retries do not insert duplicates. SHARED_CACHE as above.
+CHAT_IDEMPOTENCY = {
+    "MAX_ENTRIES": 100000,
+    "TTL": 24 * 60 * 60,
+    "PENDING_TTL": 30,
+    "SHARED_CACHE": None,
+}
+
+# Optional write-behind for message creation: requests are answered with 202
+# and a provisional id while a background thread inserts queued messages in
+# batches of BATCH_SIZE or every FLUSH_INTERVAL_MS. Requests are refused with
+# 503 once MAX_QUEUE messages wait longer than ENQUEUE_TIMEOUT_MS. A failing
+# batch is retried RETRIES times, RETRY_DELAY_MS apart, then written row by row
+# and rows that still fail are logged as dead letters.
+CHAT_WRITE_BEHIND = {
+    "ENABLED": False,
+    "MAX_QUEUE": 10000,
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL_MS": 50,
+    "ENQUEUE_TIMEOUT_MS": 100,
+    "RETRIES": 2,
+    "RETRY_DELAY_MS": 100,
+}
+
+# Token-bucket budgets of unsafe requests per scope, for the authenticated
+# user (the attempted username from that address on login) and for the client
+# address. A rate "N/period" refills N tokens per period and allows bursts of
+# N. "longpoll" budgets the ``?wait=`` history requests, the only throttled
+# reads since each one parks a subscription. Use
+# ``chat_group.throttling.RedisBucketStore`` with
+# ``{"url": "redis://..."}`` as OPTIONS to share the budgets between nodes.
+CHAT_THROTTLE = {
+    "ENABLED": True,
+    "BACKEND": "chat_group.throttling.LocalBucketStore",
+    "OPTIONS": {},
+    "RATES": {
+        "messages": {"user": "120/min", "ip": "1200/min"},
+        "reactions": {"user": "240/min", "ip": "2400/min"},
+        "membership": {"user": "60/min", "ip": "600/min"},
+        "login": {"user": "10/min", "ip": "60/min"},
+        "longpoll": {"user": "120/min", "ip": "1200/min"},
+    },
+}
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+_DONE = object()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """``ASGIHandler`` reading streaming response bodies in a worker thread.
+
+    Django 3.2 iterates streaming content on the event loop, which raises
+    ``SynchronousOnlyOperation`` for bodies produced by ORM queries, such as
+    message exports, and would stall the loop otherwise. Every part of one
+    response is pulled from the same dedicated thread so database cursors
+    stay on the connection that opened them.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append(
+                (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            }
+        )
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-stream")
+        try:
+            parts = iter(response)
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, _DONE)
+                if part is _DONE:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            await send({"type": "http.response.body"})
+        finally:
+            # closes the body generators and the thread's connections
+            await loop.run_in_executor(executor, response.close)
+            executor.shutdown(wait=False)
+            await sync_to_async(close_old_connections)()
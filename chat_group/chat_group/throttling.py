@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400}
+
+# KEYS[1] bucket, ARGV rate per second, capacity, now; returns the wait in
+# milliseconds, 0 when a token was taken
+TOKEN_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return wait
+"""
+
+
+def parse_rate(rate):
+    """``"30/min"`` to ``(tokens per second, capacity)``."""
+    count, period = rate.split("/")
+    return int(count) / PERIODS[period], int(count)
+
+
+def refill(tokens, updated, rate, capacity, now):
+    """Take one token from a bucket, return ``(tokens, wait seconds)``."""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    """Token buckets of this process, bounded to ``max_entries`` keys by
+    evicting the least recently used one."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens, wait = refill(tokens, updated, rate, capacity, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Token buckets shared by every node through a redis compatible server,
+    each check is one atomic script call."""
+
+    def __init__(self, url="redis://localhost:6379/0", client=None, prefix="throttle:"):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def consume(self, key, rate, capacity):
+        wait = self.client.eval(
+            TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, capacity, time.time()
+        )
+        return int(wait) / 1000
+
+    def clear(self):
+        pass
+
+
+class LocalRedisBuckets:
+    """In-memory stand-in for the redis client of ``RedisBucketStore``,
+    running ``TOKEN_BUCKET_SCRIPT`` in Python. Share one instance between
+    stores to emulate several nodes."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def eval(self, script, numkeys, key, rate, capacity, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = refill(tokens, updated, rate, capacity, now)
+            self._buckets[key] = (tokens, now)
+        return math.ceil(wait * 1000)
+
+
+class Throttling:
+    def __init__(self, store, rates, enabled=True):
+        self.store = store
+        self.enabled = enabled
+        self.rates = {
+            scope: {kind: parse_rate(rate) for kind, rate in limits.items()}
+            for scope, limits in rates.items()
+        }
+
+    def check(self, scope, identities):
+        """Take a token from the ``scope`` bucket of every ``{kind: identity}``
+        in order, return the wait in seconds of the first empty one, 0 when
+        the request may go ahead."""
+        limits = self.rates.get(scope)
+        if not self.enabled or not limits:
+            return 0.0
+        for kind, identity in identities.items():
+            if kind not in limits:
+                continue
+            rate, capacity = limits[kind]
+            wait = self.store.consume(f"{scope}:{kind}:{identity}", rate, capacity)
+            if wait:
+                return wait
+        return 0.0
+
+
+_throttling = None
+_throttling_lock = threading.Lock()
+
+
+def get_throttling():
+    global _throttling
+    if _throttling is None:
+        with _throttling_lock:
+            if _throttling is None:
+                config = settings.CHAT_THROTTLE
+                store = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+                _throttling = Throttling(
+                    store, config.get("RATES", {}), config.get("ENABLED", True)
+                )
+    return _throttling
+
+
+@receiver(setting_changed)
+def reset_throttling(*, setting, **kwargs):
+    global _throttling
+    if setting == "CHAT_THROTTLE":
+        _throttling = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Applies the ``CHAT_THROTTLE`` budgets of the view's scope to unsafe
+    requests, one bucket per user and one per client address.
+
+    The scope is ``view.throttle_scope`` or ``view.throttle_scopes[action]``,
+    views without one are not throttled. For logins the user bucket is keyed
+    by the attempted username and the address, so failed attempts from
+    elsewhere cannot lock the owner of the name out.
+    """
+
+    def __init__(self):
+        self.wait_seconds = 0.0
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        scope = getattr(view, "throttle_scope", None) or getattr(
+            view, "throttle_scopes", {}
+        ).get(getattr(view, "action", None))
+        if scope is None:
+            return True
+        # the user bucket goes first so an exhausted user does not drain the
+        # budget shared by everyone behind the same address
+        identities = {}
+        ident = self.get_ident(request)
+        user = request.user
+        if user is not None and user.is_authenticated:
+            identities["user"] = str(user.pk)
+        elif scope == "login":
+            username = request.data.get("username")
+            if isinstance(username, str) and username:
+                identities["user"] = f"name:{username}:{ident}"
+        identities["ip"] = ident
+        self.wait_seconds = get_throttling().check(scope, identities)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
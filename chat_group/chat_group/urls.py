@@ -5,6 +5,8 @@ from drf_yasg import openapi
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 
+from chat_group.metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="GroupChat API Documentation",
@@ -20,6 +22,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     re_path(
         r"^doc(?P<format>\.json|\.yaml)$",
         schema_view.without_ui(cache_timeout=0),
@@ -1,19 +1,33 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from chats.constants import SERIALIZER_STATUS_CHOICES
+from chats.membership import get_membership_cache
 from chats.models import Message, ChatGroup, MessageStatus
+from chats.sharding import (
+    create_group,
+    fan_out,
+    partition,
+    shard_for_group,
+    use_shard,
+)
 
 User = get_user_model()
 
 
 class GetMessageSerializer(serializers.ModelSerializer):
+    sender = serializers.SlugRelatedField(read_only=True, slug_field="username")
+
     class Meta:
         model = Message
         fields = (
+            "id",
             "text",
-            "sender__username",
+            "sender",
+            "timestamp",
         )
 
 
@@ -29,11 +43,97 @@ class CreateMessageSerializer(serializers.ModelSerializer):
         )
 
     def create_message(self, sender, group):
-        Message.objects.create(
+        return Message.objects.create(
             sender=sender, group=group, text=self.validated_data["text"]
         )
 
 
+class BulkMessageItemSerializer(serializers.Serializer):
+    text = serializers.CharField(required=True)
+    group = serializers.IntegerField(required=True)
+
+
+class BulkCreateMessageSerializer(serializers.Serializer):
+    messages = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.CHAT_BULK_MAX_MESSAGES,
+    )
+
+    def create_messages(self, sender):
+        """Insert every valid item and return one result per input item.
+
+        Items are validated one by one but group membership of the sender is
+        resolved for all groups with a single query per shard, inserts are
+        chunked per shard and every chunk commits on its own. Backends that
+        return no rows from bulk inserts get one insert per message, so that
+        every created result carries its id.
+        """
+        items = self.validated_data["messages"]
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            item_serializer = BulkMessageItemSerializer(data=item)
+            if item_serializer.is_valid():
+                valid.append((index, item_serializer.validated_data))
+            else:
+                results[index] = {
+                    "index": index,
+                    "status": "rejected",
+                    "errors": item_serializer.errors,
+                }
+
+        group_ids = {item["group"] for _, item in valid}
+        allowed_groups = set(
+            fan_out(
+                ChatGroup.members.through.objects.filter(
+                    user_id=sender.pk, chatgroup_id__in=group_ids
+                ).values_list("chatgroup_id", flat=True)
+            )
+        )
+        accepted = []
+        for index, item in valid:
+            if item["group"] not in allowed_groups:
+                results[index] = {
+                    "index": index,
+                    "status": "rejected",
+                    "errors": {
+                        "group": [f"User is not a part of the group {item['group']}"]
+                    },
+                }
+                continue
+            accepted.append(
+                (
+                    index,
+                    Message(sender=sender, group_id=item["group"], text=item["text"]),
+                )
+            )
+
+        chunk_size = settings.CHAT_BULK_CHUNK_SIZE
+        shards = partition(accepted, lambda item: shard_for_group(item[1].group_id))
+        for alias, shard_accepted in shards.items():
+            with use_shard(alias):
+                for start in range(0, len(shard_accepted), chunk_size):
+                    chunk = shard_accepted[start : start + chunk_size]
+                    using = router.db_for_write(Message)
+                    with transaction.atomic(using=using):
+                        messages = [message for _, message in chunk]
+                        features = connections[using].features
+                        if features.can_return_rows_from_bulk_insert:
+                            Message.objects.bulk_create(messages)
+                        else:
+                            for message in messages:
+                                message.save(force_insert=True, using=using)
+                    for index, message in chunk:
+                        results[index] = {
+                            "index": index,
+                            "status": "created",
+                            "id": message.pk,
+                            "group": message.group_id,
+                        }
+        return results
+
+
 class EditMessageSerializer(serializers.ModelSerializer):
     text = serializers.CharField(required=True)
 
@@ -43,13 +143,26 @@ class EditMessageSerializer(serializers.ModelSerializer):
 
 
 class GetChatGroupSerializer(serializers.ModelSerializer):
-    members = serializers.SlugRelatedField(
-        many=True, read_only=True, slug_field="username"
-    )
+    """Group summary, expects the annotations of ``ChatGroup.objects.summary()``.
+
+    Members are listed by the paginated ``members`` endpoint instead.
+    """
+
+    member_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatGroup
-        fields = "__all__"
+        fields = ("id", "name", "owner", "member_count", "last_message")
+
+    def get_last_message(self, instance):
+        if instance.last_message_id is None:
+            return None
+        return {
+            "id": instance.last_message_id,
+            "preview": instance.last_message_preview,
+            "timestamp": instance.last_message_timestamp,
+        }
 
 
 class PostChatGroupSerializer(serializers.ModelSerializer):
@@ -62,7 +175,7 @@ class PostChatGroupSerializer(serializers.ModelSerializer):
     def save(self, **kwargs):
         user = self.context["request"].user
         name = self.validated_data["name"]
-        instance = ChatGroup.objects.create(name=name, owner=user)
+        instance = create_group(name=name, owner=user)
         instance.members.add(user)
         return instance
 
@@ -81,14 +194,36 @@ class UpdateChatGroupSerializer(serializers.ModelSerializer):
         return self.instance
 
 
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=True, max_length=256)
+    page = serializers.IntegerField(required=False, min_value=1, default=1)
+
+
+class ReadMarkerSerializer(serializers.Serializer):
+    message_id = serializers.IntegerField(required=True, min_value=1)
+
+
+class GroupMemberSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "username")
+
+
 class MemberSerializer(serializers.Serializer):
-    members = serializers.ListField(required=True)
+    members = serializers.ListField(required=True, child=serializers.CharField())
 
-    def validate_members(self, members):
-        for member in members:
-            if not User.objects.filter(username=member).exists():
-                raise ValidationError(f"Member: {member} does not exists.")
-        return members
+    def validate(self, attrs):
+        members = attrs["members"]
+        member_ids = dict(
+            User.objects.filter(username__in=set(members)).values_list("username", "id")
+        )
+        missing = sorted(set(members) - set(member_ids))
+        if missing:
+            raise ValidationError(
+                {"members": f"Members: {', '.join(missing)} do not exist."}
+            )
+        attrs["member_ids"] = list(member_ids.values())
+        return attrs
 
 
 class MessageStatusGetSerializer(serializers.ModelSerializer):
@@ -99,3 +234,41 @@ class MessageStatusGetSerializer(serializers.ModelSerializer):
 
 class MessageStatusSerializer(serializers.Serializer):
     status = serializers.ChoiceField(required=True, choices=SERIALIZER_STATUS_CHOICES)
+
+
+class ReactionItemSerializer(serializers.Serializer):
+    message = serializers.IntegerField(required=True)
+    status = serializers.ChoiceField(
+        required=True, allow_null=True, choices=SERIALIZER_STATUS_CHOICES
+    )
+
+
+class ReactionBatchSerializer(serializers.Serializer):
+    reactions = serializers.ListField(
+        child=ReactionItemSerializer(),
+        allow_empty=False,
+        max_length=settings.CHAT_REACTIONS_BATCH_MAX,
+    )
+
+    def validate(self, attrs):
+        # later items for the same message win
+        changes = {item["message"]: item["status"] for item in attrs["reactions"]}
+        groups = dict(
+            fan_out(
+                Message.objects.filter(id__in=changes).values_list("id", "group_id")
+            )
+        )
+        user_id = self.context["request"].user.pk
+        membership = get_membership_cache()
+        invalid = sorted(
+            pk
+            for pk in changes
+            if pk not in groups or not membership.is_member(groups[pk], user_id)
+        )
+        if invalid:
+            raise serializers.ValidationError(
+                {"reactions": [f"Messages not found: {invalid}"]}
+            )
+        attrs["changes"] = changes
+        attrs["groups"] = groups
+        return attrs
@@ -1,9 +1,17 @@
+import collections
 from datetime import timedelta
+from operator import attrgetter, itemgetter
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
@@ -13,21 +21,60 @@ from .serializers import (
     UpdateChatGroupSerializer,
     MemberSerializer,
     CreateMessageSerializer,
+    BulkCreateMessageSerializer,
     EditMessageSerializer,
     MessageStatusSerializer,
     MessageStatusGetSerializer,
+    GetMessageSerializer,
+    SearchQuerySerializer,
+    ReadMarkerSerializer,
+    ReactionBatchSerializer,
+    GroupMemberSerializer,
 )
 from chats.models import ChatGroup
+from chats.export import export_group
+from chats.conditional import (
+    group_history_etag,
+    not_modified,
+    reaction_etag,
+    set_validator,
+)
+from chats.expressions import SubqueryCount
+from chats.idempotency import PENDING, get_idempotency_store, request_fingerprint
+from chats.longpoll import messages_after
+from chats.membership import get_membership_cache
+from chats.pagination import MessageKeysetPaginator, get_page_size
+from chats.renderers import MESSAGE_COLUMNS, message_renderers
+from chats.reactions import (
+    apply_reactions,
+    get_page_reactions,
+    get_reaction_summary,
+    set_reaction,
+)
+from chats.search import search_messages
+from chats.sharding import (
+    bind_shard,
+    fan_out,
+    partition,
+    shard_for_group,
+    shard_for_message,
+    use_shard,
+)
+from chats.realtime import message_event, publish_group_event, status_event
+from chats.writebehind import QueueFull, get_write_buffer, write_behind_enabled
 
-from ..models import Message, MessageStatus
+from ..models import Message, MessageStatus, ReadMarker
 
 User = get_user_model()
 
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
 
 class ChatGroupViewset(viewsets.ModelViewSet):
     queryset = ChatGroup.objects.all()
     http_method_names = ["get", "patch", "post", "delete"]
     serializer_get = GetChatGroupSerializer
+    throttle_scopes = {"members": "membership"}
     # permission_classes = (IsAuthenticated,)
 
     def get_serializer_class(self):
@@ -38,18 +85,35 @@ class ChatGroupViewset(viewsets.ModelViewSet):
         if self.request.method.lower() == "patch":
             return UpdateChatGroupSerializer
 
+    def dispatch(self, request, *args, **kwargs):
+        # detail routes run on the shard of their group
+        with use_shard(shard_for_group(kwargs.get("pk"))):
+            return super().dispatch(request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = super().get_queryset()
         request_user = self.request.user
-        queryset = queryset.filter(members__username=request_user.username)
+        if not request_user.is_authenticated:
+            return queryset.none()
+        queryset = queryset.filter(members=request_user)
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.summary().order_by("id")
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        groups = fan_out(self.get_queryset(), key=attrgetter("pk"))
+        return Response(self.get_serializer(groups, many=True).data)
+
+    def get_summary(self, instance):
+        groups = ChatGroup.objects.db_manager(instance._state.db)
+        return self.serializer_get(groups.summary().get(pk=instance.pk)).data
+
     def create(self, request, *args, **kwargs):
         data = request.data
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
-        response_data = self.serializer_get(instance).data
+        response_data = self.get_summary(instance)
         return Response(data=response_data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
@@ -63,12 +127,12 @@ class ChatGroupViewset(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
-        response_data = self.serializer_get(instance).data
+        response_data = self.get_summary(instance)
         return Response(data=response_data, status=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.onwer != self.request.user:
+        if instance.owner != self.request.user:
             return Response(
                 status=status.HTTP_401_UNAUTHORIZED,
                 data="User is not same as owner of chatgroup!",
@@ -76,53 +140,246 @@ class ChatGroupViewset(viewsets.ModelViewSet):
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(methods=["post", "delete"], detail=True)
+    @action(methods=["get", "post", "delete"], detail=True)
     def members(self, request, pk=None, *args, **kwargs):
         group = self.get_object()
+        if request.method.lower() == "get":
+            return self.list_members(request, group)
         serializer = MemberSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
             members = serializer.validated_data["members"]
-            member_users = User.objects.filter(username__in=members)
+            member_ids = serializer.validated_data["member_ids"]
             if request.method.lower() == "post":
-                for member in member_users:
-                    group.members.add(member)
+                # one lookup of existing rows and one bulk insert of the rest
+                group.members.add(*member_ids)
                 return Response(
                     {"status": f"Members Added in group `{group.name}`: {members}"}
                 )
 
             if request.method.lower() == "delete":
-                for member in member_users:
-                    group.members.remove(member)
+                group.members.remove(*member_ids)
+                publish_group_event(
+                    group.pk, {"type": "members.removed", "users": member_ids}
+                )
                 return Response(
                     {"status": f"Members Removed from group `{group.name}`: {members}"}
                 )
 
-    @action(methods=["get"], detail=True)
+    def list_members(self, request, group):
+        limit = get_page_size(
+            request,
+            default=settings.CHAT_MEMBERS_PAGE_SIZE,
+            maximum=settings.CHAT_MEMBERS_MAX_PAGE_SIZE,
+        )
+        members = group.members.order_by("id")
+        after = request.query_params.get("after")
+        if after is not None:
+            try:
+                members = members.filter(id__gt=int(after))
+            except ValueError:
+                raise ValidationError("after must be a member id.")
+        page = list(members.only("id", "username")[: limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        response = {
+            "members": GroupMemberSerializer(page, many=True).data,
+            "next": page[-1].pk if has_more else None,
+        }
+        return Response(data=response, status=status.HTTP_200_OK)
+
+    @action(methods=["get"], detail=True, renderer_classes=message_renderers())
     def messages(self, request, pk=None, *args, **kwargs):
-        group = self.get_object()
-        user = request.user
-        if not group.members.filter(username=user.username).exists():
+        try:
+            group_id = int(pk)
+        except ValueError:
+            raise Http404
+        if not get_membership_cache().is_member(group_id, request.user.pk):
             return Response(
                 status=status.HTTP_401_UNAUTHORIZED,
                 data="Only Members of the group can read messages",
             )
-        from_query_param = request.query_params.get(
-            "from", 1
-        )  # this is to get message from last hour
-        time_from = timezone.now() - timedelta(hours=from_query_param)
-        messages = Message.objects.filter(group=group, timestamp__gte=time_from)
-        messages_block = []
-        for message in messages.values("text", "sender__username", "timestamp"):
-            message["sender"] = message.pop("sender__username")
-            messages_block.append(message)
-        response = {"messages": messages_block}
+        after_id = request.query_params.get("after_id")
+        if after_id is not None:
+            # polling for new messages, ``wait`` is served by the ASGI app
+            try:
+                after_id = int(after_id)
+            except ValueError:
+                raise ValidationError("after_id must be an integer.")
+            page = messages_after(group_id, after_id, get_page_size(request))
+            return Response(data=page, status=status.HTTP_200_OK)
+        messages = Message.objects.filter(group_id=group_id)
+        since = etag = None
+        embed_reactions = request.query_params.get("reactions") in ("1", "true")
+        from_query_param = request.query_params.get("from")
+        if from_query_param is None and not embed_reactions:
+            # pages relative to "now" and reactions have no cheap validator
+            etag = group_history_etag(group_id, request.query_params.urlencode())
+            cached = not_modified(request, etag)
+            if cached is not None:
+                return cached
+        if from_query_param is not None:
+            # optional window of hours back from now
+            try:
+                hours = int(from_query_param)
+            except ValueError:
+                raise ValidationError("from must be a number of hours.")
+            since = timezone.now() - timedelta(hours=hours)
+            messages = messages.filter(timestamp__gte=since)
+        paginator = MessageKeysetPaginator(
+            messages,
+            limit=get_page_size(request),
+            before=request.query_params.get("before"),
+            after=request.query_params.get("after"),
+            archive_group_id=group_id,
+            since=since,
+        )
+        rows, cursors = paginator.get_page("text", "sender__username")
+        columns = MESSAGE_COLUMNS
+        if embed_reactions:
+            summaries, own = get_page_reactions(
+                [row[0] for row in rows], request.user.pk, paginator.archived
+            )
+            columns += ("reactions", "my_reaction")
+            rows = [row + (summaries[row[0]], own[row[0]]) for row in rows]
+        if request.query_params.get("layout") == "columns":
+            response = {"columns": columns, "rows": rows, **cursors}
+        else:
+            response = {
+                "messages": [dict(zip(columns, row)) for row in rows],
+                **cursors,
+            }
+        return set_validator(Response(data=response, status=status.HTTP_200_OK), etag)
+
+    @action(methods=["post"], detail=True)
+    def read(self, request, pk=None, *args, **kwargs):
+        try:
+            group_id = int(pk)
+        except ValueError:
+            raise Http404
+        if not get_membership_cache().is_member(group_id, request.user.pk):
+            return Response(
+                status=status.HTTP_401_UNAUTHORIZED,
+                data="Only Members of the group can mark messages as read",
+            )
+        serializer = ReadMarkerSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        message_id = serializer.validated_data["message_id"]
+        if not Message.objects.filter(group_id=group_id, id=message_id).exists():
+            raise ValidationError({"message_id": "Message not found in this group."})
+        # markers only ever move forward
+        updated = ReadMarker.objects.filter(
+            user=request.user,
+            group_id=group_id,
+            last_read_message_id__lt=message_id,
+        ).update(last_read_message_id=message_id)
+        if not updated:
+            ReadMarker.objects.get_or_create(
+                user=request.user,
+                group_id=group_id,
+                defaults={"last_read_message_id": message_id},
+            )
+        last_read = ReadMarker.objects.filter(
+            user=request.user, group_id=group_id
+        ).values_list("last_read_message_id", flat=True)[0]
+        return Response(
+            data={"group": group_id, "last_read_message_id": last_read},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(methods=["get"], detail=False, permission_classes=(IsAuthenticated,))
+    def unread(self, request, *args, **kwargs):
+        cap = settings.CHAT_UNREAD_CAP
+        last_read = ReadMarker.objects.filter(
+            user=request.user, group=OuterRef("pk")
+        ).values("last_read_message_id")[:1]
+        # counting at most cap + 1 rows per group bounds the index range scan,
+        # the caller's own messages are never unread
+        unread = (
+            Message.objects.filter(group=OuterRef("pk"), id__gt=OuterRef("last_read"))
+            .exclude(sender_id=request.user.pk)
+            .values("id")[: cap + 1]
+        )
+        groups = fan_out(
+            ChatGroup.objects.filter(members=request.user)
+            .annotate(last_read=Coalesce(Subquery(last_read), 0))
+            .annotate(unread=SubqueryCount(unread))
+            .order_by("id")
+            .values_list("id", "unread"),
+            key=itemgetter(0),
+        )
+        response = {
+            "groups": [
+                {
+                    "group": group_id,
+                    "unread": min(count, cap),
+                    "display": f"{cap}+" if count > cap else str(count),
+                }
+                for group_id, count in groups
+            ]
+        }
+        return Response(data=response, status=status.HTTP_200_OK)
+
+    @action(methods=["get"], detail=True)
+    def search(self, request, pk=None, *args, **kwargs):
+        try:
+            group_id = int(pk)
+        except ValueError:
+            raise Http404
+        if not get_membership_cache().is_member(group_id, request.user.pk):
+            return Response(
+                status=status.HTTP_401_UNAUTHORIZED,
+                data="Only Members of the group can search messages",
+            )
+        serializer = SearchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        limit = get_page_size(request)
+        page = serializer.validated_data["page"]
+        results = search_messages(
+            group_id,
+            serializer.validated_data["q"],
+            limit=limit + 1,
+            offset=(page - 1) * limit,
+        )
+        response = {
+            "results": results[:limit],
+            "page": page,
+            "has_more": len(results) > limit,
+        }
         return Response(data=response, status=status.HTTP_200_OK)
 
+    @action(methods=["get"], detail=True)
+    def export(self, request, pk=None, *args, **kwargs):
+        try:
+            group_id = int(pk)
+        except ValueError:
+            raise Http404
+        if not get_membership_cache().is_member(group_id, request.user.pk):
+            return Response(
+                status=status.HTTP_401_UNAUTHORIZED,
+                data="Only Members of the group can export messages",
+            )
+        compress = request.query_params.get("gzip") in ("1", "true")
+        columns = request.query_params.get("layout") == "columns"
+        response = StreamingHttpResponse(
+            bind_shard(export_group(group_id, compress=compress, columns=columns)),
+            content_type="application/gzip" if compress else "application/x-ndjson",
+        )
+        filename = f"chatgroup-{group_id}.ndjson" + (".gz" if compress else "")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
 
 class MessageViewset(viewsets.ModelViewSet):
     queryset = Message.objects.all()
-    http_method_names = ["patch", "post", "get"]
-    serializer_get = GetChatGroupSerializer
+    # delete is only served by the `status` action
+    http_method_names = ["patch", "post", "get", "delete"]
+    serializer_get = GetMessageSerializer
+    throttle_scopes = {
+        "create": "messages",
+        "bulk": "messages",
+        "status": "reactions",
+        "reactions": "reactions",
+    }
 
     def get_serializer_class(self):
         if self.request.method.lower() == "post":
@@ -130,23 +387,123 @@ class MessageViewset(viewsets.ModelViewSet):
         if self.request.method.lower() == "patch":
             return EditMessageSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "status" and self.request.method.lower() == "get":
+            # the reactions validator comes with the lookup
+            queryset = queryset.annotate(reaction_version=F("reaction_counts__version"))
+        return queryset
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_shard(shard_for_message(kwargs.get("pk"))):
+            return super().dispatch(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key") or request.data.get(
+            "client_message_id"
+        )
+        if key is not None and not isinstance(key, str):
+            raise ValidationError("client_message_id must be a string.")
+        if not key:
+            return self._create_message(request)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValidationError("Idempotency-Key is too long.")
+        store = get_idempotency_store()
+        fingerprint = request_fingerprint(
+            request.data.get("group"), request.data.get("text")
+        )
+        entry = store.begin(request.user.pk, key, fingerprint)
+        if entry is not None:
+            return self._replay(entry, fingerprint)
+        try:
+            response = self._create_message(request)
+        except Exception:
+            store.release(request.user.pk, key)
+            raise
+        if status.is_success(response.status_code):
+            store.complete(
+                request.user.pk, key, fingerprint, response.status_code, response.data
+            )
+        else:
+            store.release(request.user.pk, key)
+        return response
+
+    def _replay(self, entry, fingerprint):
+        if entry["fingerprint"] != fingerprint:
+            return Response(
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                data="Idempotency-Key was already used for a different message",
+            )
+        if entry["state"] == PENDING:
+            return Response(
+                status=status.HTTP_409_CONFLICT,
+                data="A request with this Idempotency-Key is in progress",
+                headers={"Retry-After": "1"},
+            )
+        return Response(
+            data=entry["data"],
+            status=entry["status"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    def _create_message(self, request):
+        with use_shard(shard_for_group(request.data.get("group"))):
+            return self._create_message_on_shard(request)
+
+    def _create_message_on_shard(self, request):
         data = request.data
         serializer = self.get_serializer(data=data)
         if serializer.is_valid(raise_exception=True):
             group = serializer.validated_data["group"]
-            if not group.members.filter(username=request.user.username).exists():
+            if not get_membership_cache().is_member(group.pk, request.user.pk):
                 return Response(
                     status=status.HTTP_401_UNAUTHORIZED,
                     data=f"User {request.user.username} is not a part of the group {group.name}",
                 )
+            if write_behind_enabled():
+                return self._enqueue_message(request, group, serializer)
             instance = serializer.create_message(sender=request.user, group=group)
+            publish_group_event(group.pk, message_event(instance))
         return Response(data="Message Created", status=status.HTTP_201_CREATED)
 
+    def _enqueue_message(self, request, group, serializer):
+        try:
+            provisional_id = get_write_buffer().submit(
+                request.user, group.pk, serializer.validated_data["text"]
+            )
+        except QueueFull:
+            return Response(
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                data="Too many pending messages, retry later",
+                headers={"Retry-After": "1"},
+            )
+        return Response(
+            data={"provisional_id": provisional_id}, status=status.HTTP_202_ACCEPTED
+        )
+
+    @action(methods=["post"], detail=False, url_path="bulk")
+    def bulk(self, request, *args, **kwargs):
+        serializer = BulkCreateMessageSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.create_messages(sender=request.user)
+        created = collections.Counter(
+            result["group"] for result in results if result["status"] == "created"
+        )
+        for group_id, count in created.items():
+            # one notification per group, clients re-read the history
+            publish_group_event(group_id, {"type": "messages.imported", "count": count})
+        all_created = sum(created.values()) == len(results)
+        return Response(
+            data={"results": results},
+            status=(
+                status.HTTP_201_CREATED if all_created else status.HTTP_207_MULTI_STATUS
+            ),
+        )
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", True)
         message = self.get_object()
-        if message.owner != request.user:
+        if message.sender != request.user:
             return Response(
                 status=status.HTTP_401_UNAUTHORIZED,
                 data=f"Owner of the message is not same as user",
@@ -154,16 +511,34 @@ class MessageViewset(viewsets.ModelViewSet):
         serializer = self.get_serializer(message, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
+        publish_group_event(
+            instance.group_id, message_event(instance, "message.updated")
+        )
         response_data = self.serializer_get(instance).data
         return Response(data=response_data, status=status.HTTP_200_OK)
 
+    def destroy(self, request, *args, **kwargs):
+        raise MethodNotAllowed(request.method)
+
     @action(methods=["post", "patch", "delete", "get"], detail=True)
     def status(self, request, pk=None, *args, **kwargs):
         message = self.get_object()
         if request.method.lower() == "get":
+            etag = reaction_etag(
+                message.pk, message.reaction_version, request.query_params.urlencode()
+            )
+            cached = not_modified(request, etag)
+            if cached is not None:
+                return cached
+            if request.query_params.get("summary") in ("1", "true"):
+                response = Response(
+                    data={"summary": get_reaction_summary(message.pk)},
+                    status=status.HTTP_200_OK,
+                )
+                return set_validator(response, etag)
             statuses = message.statuses.all()
             if statuses:
-                return Response(
+                response = Response(
                     data={
                         "data": MessageStatusGetSerializer(
                             instance=statuses, many=True
@@ -171,46 +546,88 @@ class MessageViewset(viewsets.ModelViewSet):
                     },
                     status=status.HTTP_200_OK,
                 )
-            return Response(
+                return set_validator(response, etag)
+            response = Response(
                 data={},
                 status=status.HTTP_200_OK,
             )
+            return set_validator(response, etag)
 
         if request.method.lower() == "delete":
-            message_status = message.statuses.filter(owner=request.user)
-            message_status.delete()
+            with transaction.atomic(using=router.db_for_write(MessageStatus)):
+                apply_reactions(request.user.pk, {message.pk: None})
+            publish_group_event(
+                message.group_id,
+                status_event(message.pk, request.user.username, None, "status.deleted"),
+            )
             return Response(data="Status Removed", status=status.HTTP_200_OK)
-        else:
-            serializer = MessageStatusSerializer(data=request.data)
-            if serializer.is_valid():
-                if request.method.lower() == "post":
-                    existing_message_status = message.statuses.filter(
-                        owner=request.user
-                    )
-                    if existing_message_status:
-                        existing_message_status.delete()
-                    message_status = MessageStatus.objects.create(
-                        owner=request.user,
-                        status=serializer.validated_data["status"],
-                        message=message,
-                    )
-                    return Response(
-                        data=MessageStatusGetSerializer(message_status).data,
-                        status=status.HTTP_201_CREATED,
-                    )
-                else:
-                    existing_message_status = message.statuses.filter(
-                        owner=request.user
-                    )
-                    if not existing_message_status:
-                        return Response(
-                            status=status.HTTP_404_NOT_FOUND,
-                            data="No status found to update",
-                        )
-                    existing_message_status = existing_message_status.first()
-                    existing_message_status.status = serializer.validated_data["status"]
-                    existing_message_status.save()
-                    return Response(
-                        data=MessageStatusGetSerializer(existing_message_status).data,
-                        status=status.HTTP_200_OK,
+        serializer = MessageStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = serializer.validated_data["status"]
+        creating = request.method.lower() == "post"
+        with transaction.atomic(using=router.db_for_write(MessageStatus)):
+            previous, reaction_id = set_reaction(
+                request.user.pk, message.pk, new_status, create=creating
+            )
+        if not creating and previous is None:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data="No status found to update",
+            )
+        message_status = MessageStatus(
+            id=reaction_id, message=message, owner=request.user, status=new_status
+        )
+        publish_group_event(
+            message.group_id,
+            status_event(
+                message.pk,
+                request.user.username,
+                new_status,
+                "status.created" if creating else "status.updated",
+            ),
+        )
+        return Response(
+            data=MessageStatusGetSerializer(message_status).data,
+            status=status.HTTP_201_CREATED if creating else status.HTTP_200_OK,
+        )
+
+    @action(methods=["post"], detail=False, url_path="reactions")
+    def reactions(self, request, *args, **kwargs):
+        serializer = ReactionBatchSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        changes = serializer.validated_data["changes"]
+        groups = serializer.validated_data["groups"]
+        previous = {}
+        # one transaction per shard, the batch is not atomic across shards
+        for alias, message_ids in partition(
+            changes, lambda pk: shard_for_group(groups[pk])
+        ).items():
+            with use_shard(alias), transaction.atomic(
+                using=router.db_for_write(MessageStatus)
+            ):
+                previous.update(
+                    apply_reactions(
+                        request.user.pk, {pk: changes[pk] for pk in message_ids}
                     )
+                )
+        results = []
+        for message_id, new_status in changes.items():
+            old_status = previous[message_id]
+            results.append(
+                {"message": message_id, "status": new_status, "previous": old_status}
+            )
+            if old_status == new_status:
+                continue
+            if new_status is None:
+                event_type = "status.deleted"
+            elif old_status is None:
+                event_type = "status.created"
+            else:
+                event_type = "status.updated"
+            publish_group_event(
+                groups[message_id],
+                status_event(message_id, request.user.username, new_status, event_type),
+            )
+        return Response(data={"results": results}, status=status.HTTP_200_OK)
@@ -0,0 +1,212 @@
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from chats.constants import SERIALIZER_STATUS_CHOICES
+from chats.models import Message, MessageArchiveSegment, MessageStatus
+from chats.sharding import fan_out, shard_for_group, use_shard
+
+ARCHIVE_BATCH_SIZE = 5000
+DELETE_CHUNK_SIZE = 500
+
+
+def row_key(row):
+    return row["timestamp"], row["id"]
+
+
+def encode_segment(rows):
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode())
+
+
+def decode_segment(payload):
+    rows = json.loads(zlib.decompress(bytes(payload)))
+    return [
+        {
+            "id": pk,
+            "timestamp": parse_datetime(timestamp),
+            "sender_id": sender_id,
+            "sender__username": sender,
+            "text": text,
+            "reactions": reactions,
+            "statuses": statuses,
+        }
+        for pk, timestamp, sender_id, sender, text, reactions, statuses in rows
+    ]
+
+
+def window_start(timestamp, window_seconds):
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % window_seconds, tz=dt_timezone.utc)
+
+
+def _write_segment(group_id, messages):
+    ids = [message[0] for message in messages]
+    statuses = defaultdict(list)
+    for message_id, owner_id, status in MessageStatus.objects.filter(
+        message_id__in=ids
+    ).values_list("message_id", "owner_id", "status"):
+        statuses[message_id].append([owner_id, status])
+    rows = []
+    for pk, timestamp, sender_id, sender, text in messages:
+        reactions = dict.fromkeys(SERIALIZER_STATUS_CHOICES, 0)
+        for _, status in statuses[pk]:
+            reactions[status] += 1
+        rows.append(
+            [
+                pk,
+                timestamp.isoformat(),
+                sender_id,
+                sender,
+                text,
+                reactions,
+                statuses[pk],
+            ]
+        )
+    with transaction.atomic(using=router.db_for_write(MessageArchiveSegment)):
+        MessageArchiveSegment.objects.create(
+            group_id=group_id,
+            first_timestamp=messages[0][1],
+            first_message_id=messages[0][0],
+            last_timestamp=messages[-1][1],
+            last_message_id=messages[-1][0],
+            message_count=len(messages),
+            payload=encode_segment(rows),
+        )
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            Message.objects.filter(
+                id__in=ids[start : start + DELETE_CHUNK_SIZE]
+            ).delete()
+
+
+def archive_group(group_id, cutoff, window_seconds):
+    """Move the group's messages older than ``cutoff`` into one compressed
+    segment per time window and return how many were archived."""
+    archived = 0
+    while True:
+        batch = list(
+            Message.objects.filter(group_id=group_id, timestamp__lt=cutoff)
+            .order_by("timestamp", "id")
+            .values_list("id", "timestamp", "sender_id", "sender__username", "text")[
+                :ARCHIVE_BATCH_SIZE
+            ]
+        )
+        if not batch:
+            return archived
+        windows = defaultdict(list)
+        for message in batch:
+            windows[window_start(message[1], window_seconds)].append(message)
+        for messages in windows.values():
+            _write_segment(group_id, messages)
+        archived += len(batch)
+
+
+def archive_messages(cutoff, window_seconds, group_ids=None):
+    if group_ids is None:
+        group_ids = fan_out(
+            Message.objects.filter(timestamp__lt=cutoff)
+            .order_by("group_id")
+            .values_list("group_id", flat=True)
+            .distinct()
+        )
+    archived = {}
+    for group_id in list(group_ids):
+        with use_shard(shard_for_group(group_id)):
+            archived[group_id] = archive_group(group_id, cutoff, window_seconds)
+    return archived
+
+
+def iter_archived_rows(group_id):
+    """Yield every archived row of the group, oldest first."""
+    segments = (
+        MessageArchiveSegment.objects.filter(group_id=group_id)
+        .order_by("first_timestamp", "first_message_id")
+        .values_list("payload", flat=True)
+    )
+    for payload in segments.iterator(chunk_size=10):
+        yield from sorted(decode_segment(payload), key=row_key)
+
+
+def archived_rows(group_id, limit, before=None, after=None, since=None, edge=None):
+    """Return up to ``limit`` archived rows next to the ``(timestamp, id)``
+    cursor, newest first unless paging forward with ``after``.
+
+    Only segment metadata is scanned through the group/key indexes,
+    payloads are fetched and decompressed while they can still contribute.
+    ``edge`` is the key of the ``limit``-th row already found elsewhere,
+    such as the hot table, segments that cannot beat it are not read.
+    """
+    segments = MessageArchiveSegment.objects.filter(group_id=group_id)
+    if since is not None:
+        segments = segments.filter(last_timestamp__gte=since)
+    if edge is not None:
+        timestamp, pk = edge
+        if after:
+            segments = segments.filter(
+                Q(first_timestamp__lt=timestamp)
+                | Q(first_timestamp=timestamp, first_message_id__lt=pk)
+            )
+        else:
+            segments = segments.filter(
+                Q(last_timestamp__gt=timestamp)
+                | Q(last_timestamp=timestamp, last_message_id__gt=pk)
+            )
+    if after:
+        timestamp, pk = after
+        segments = segments.filter(
+            Q(last_timestamp__gt=timestamp)
+            | Q(last_timestamp=timestamp, last_message_id__gt=pk)
+        ).order_by("first_timestamp", "first_message_id")
+    else:
+        if before:
+            timestamp, pk = before
+            segments = segments.filter(
+                Q(first_timestamp__lt=timestamp)
+                | Q(first_timestamp=timestamp, first_message_id__lt=pk)
+            )
+        segments = segments.order_by("-last_timestamp", "-last_message_id")
+
+    rows = []
+    for segment in segments.values(
+        "id", "first_timestamp", "first_message_id", "last_timestamp", "last_message_id"
+    ):
+        if len(rows) >= limit:
+            # segments are ordered by their near edge, once that edge is past
+            # the limit-th best row no later segment can contribute
+            boundary = row_key(rows[limit - 1])
+            if (
+                after
+                and (
+                    segment["first_timestamp"],
+                    segment["first_message_id"],
+                )
+                > boundary
+            ):
+                break
+            if (
+                not after
+                and (
+                    segment["last_timestamp"],
+                    segment["last_message_id"],
+                )
+                < boundary
+            ):
+                break
+        payload = MessageArchiveSegment.objects.filter(pk=segment["id"]).values_list(
+            "payload", flat=True
+        )[0]
+        for row in decode_segment(payload):
+            if since is not None and row["timestamp"] < since:
+                continue
+            if after and row_key(row) <= after:
+                continue
+            if before and row_key(row) >= before:
+                continue
+            rows.append(row)
+        rows.sort(key=row_key, reverse=not after)
+        del rows[limit:]
+    return rows
@@ -0,0 +1,337 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from chat_group.metrics import QueryCounter, counting_queries
+from chats.chat_client import ChatTestApiClient
+from chats.constants import SERIALIZER_STATUS_CHOICES
+from chats.models import ChatGroup, Message, MessageStatus
+from chats.reactions import apply_reactions
+from chats.renderers import (
+    MESSAGE_COLUMNS,
+    FastJSONRenderer,
+    MessagePackRenderer,
+    msgpack,
+    orjson,
+)
+from chats.sharding import (
+    create_group,
+    fan_out,
+    partition,
+    replicate_users,
+    shard_for_group,
+    sharding_enabled,
+    use_shard,
+)
+
+User = get_user_model()
+
+BENCHMARK_PASSWORD = "bench"
+DEFAULT_MIX = {"post": 4, "read": 4, "react": 2, "membership": 1}
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = max(0, int(round(percent / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def seed(users=20, groups=5, members_per_group=10, messages=1000, reactions=200):
+    """Create the benchmark users, groups, memberships, messages and reactions
+    that are missing, through the shard placement of the app, and return the
+    usernames and the members of every group. Seeding a seeded database again
+    adds nothing."""
+    rng = random.Random(0)
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        (User(username=f"bench{i}", password=password) for i in range(users)),
+        ignore_conflicts=True,
+    )
+    names = dict(
+        User.objects.filter(username__in=[f"bench{i}" for i in range(users)])
+        .order_by("id")
+        .values_list("id", "username")
+    )
+    user_ids = list(names)
+    if sharding_enabled():
+        # bulk inserts skip the post_save replication
+        replicate_users(user_ids)
+
+    group_names = [f"bench group {i}" for i in range(groups)]
+    existing = dict(
+        fan_out(
+            ChatGroup.objects.filter(name__in=group_names).values_list("name", "id")
+        )
+    )
+    group_ids = []
+    for name in group_names:
+        owner_id = rng.choice(user_ids)
+        if name not in existing:
+            existing[name] = create_group(name=name, owner_id=owner_id).pk
+        group_ids.append(existing[name])
+
+    Through = ChatGroup.members.through
+    members = {}
+    for group_id in group_ids:
+        sample = rng.sample(user_ids, min(members_per_group, len(user_ids)))
+        with use_shard(shard_for_group(group_id)):
+            Through.objects.bulk_create(
+                [Through(chatgroup_id=group_id, user_id=user_id) for user_id in sample],
+                ignore_conflicts=True,
+            )
+            members[group_id] = sorted(
+                Through.objects.filter(
+                    chatgroup_id=group_id, user_id__in=user_ids
+                ).values_list("user_id", flat=True)
+            )
+
+    shards = partition(group_ids, shard_for_group)
+    seeded = 0
+    for alias, shard_group_ids in shards.items():
+        with use_shard(alias):
+            seeded += Message.objects.filter(group_id__in=shard_group_ids).count()
+    message_rows = defaultdict(list)
+    for i in range(seeded, messages):
+        group_id = rng.choice(group_ids)
+        message_rows[shard_for_group(group_id)].append(
+            Message(
+                group_id=group_id,
+                sender_id=rng.choice(members[group_id]),
+                text=f"benchmark message {i}",
+            )
+        )
+    # reactions come with new messages only, so reseeding leaves them be
+    changes = defaultdict(lambda: defaultdict(dict))
+    for alias, rows in message_rows.items():
+        with use_shard(alias):
+            Message.objects.bulk_create(rows, batch_size=1000)
+            message_ids = list(
+                Message.objects.filter(group_id__in=shards[alias]).values_list(
+                    "id", flat=True
+                )
+            )
+        for _ in range(round(reactions * len(rows) / (messages - seeded))):
+            changes[alias][rng.choice(user_ids)][rng.choice(message_ids)] = rng.choice(
+                SERIALIZER_STATUS_CHOICES
+            )
+    for alias, by_owner in changes.items():
+        with use_shard(alias):
+            for owner_id, by_message in by_owner.items():
+                with transaction.atomic(using=router.db_for_write(MessageStatus)):
+                    apply_reactions(owner_id, by_message)
+
+    return {
+        "usernames": [names[user_id] for user_id in user_ids],
+        "memberships": {
+            group_id: {names[user_id] for user_id in group_members}
+            for group_id, group_members in members.items()
+        },
+    }
+
+
+class SimulatedUser:
+    def __init__(self, username, groups, outsiders, mix, rng):
+        self.username = username
+        self.groups = groups
+        self.outsiders = outsiders
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.rng = rng
+        self.client = ChatTestApiClient(username, BENCHMARK_PASSWORD)
+        # server errors are reported as failed requests instead of raised
+        self.client.client.raise_request_exception = False
+        self.last_message_ids = []
+
+    def step(self):
+        """Pick the next operation and return its requests, ``(endpoint,
+        call)`` pairs timed one by one."""
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        group_id = self.rng.choice(self.groups)
+        if operation == "post":
+            return [
+                ("post", lambda: self.client.post_message("benchmark post", group_id))
+            ]
+        if operation == "react" and self.last_message_ids:
+            message_id = self.rng.choice(self.last_message_ids)
+            status = self.rng.choice(SERIALIZER_STATUS_CHOICES)
+            return [("react", lambda: self.client.like_message(message_id, status))]
+        # only seeded non-members are added and removed again, so simulated
+        # users never lose access to their own groups
+        outsiders = self.outsiders[group_id]
+        if operation == "membership" and outsiders:
+            other = [self.rng.choice(outsiders)]
+            return [
+                ("membership.add", lambda: self.client.add_members(group_id, other)),
+                (
+                    "membership.remove",
+                    lambda: self.client.remove_members(group_id, other),
+                ),
+            ]
+        return [("read", lambda: self.read(group_id))]
+
+    def read(self, group_id):
+        response = self.client.get_messages(group_id)
+        if response.status_code == 200:
+            self.last_message_ids = [m["id"] for m in response.json()["messages"]]
+        return response
+
+
+def run(dataset, concurrency=4, iterations=50, mix=None, seed_value=0):
+    """Drive ``concurrency`` simulated users for ``iterations`` steps each and
+    return a JSON serializable report of latency, throughput and SQL use per
+    endpoint. ``concurrency=1`` runs in the calling thread."""
+    mix = mix or DEFAULT_MIX
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    groups_by_user = defaultdict(list)
+    for group_id, usernames in dataset["memberships"].items():
+        for username in usernames:
+            groups_by_user[username].append(group_id)
+    active_users = [u for u in dataset["usernames"] if groups_by_user[u]]
+    outsiders = {
+        group_id: sorted(set(dataset["usernames"]) - members)
+        for group_id, members in dataset["memberships"].items()
+    }
+
+    def worker(index):
+        rng = random.Random(seed_value + index)
+        username = active_users[index % len(active_users)]
+        user = SimulatedUser(username, groups_by_user[username], outsiders, mix, rng)
+        user.client.login()
+        local_samples = defaultdict(list)
+        local_errors = defaultdict(int)
+        for _ in range(iterations):
+            for endpoint, call in user.step():
+                counter = QueryCounter()
+                start = time.perf_counter()
+                with counting_queries(counter):
+                    response = call()
+                elapsed = time.perf_counter() - start
+                local_samples[endpoint].append(
+                    (elapsed, counter.queries, counter.seconds)
+                )
+                if response.status_code >= 400:
+                    local_errors[endpoint] += 1
+        connections.close_all()
+        with lock:
+            for endpoint, values in local_samples.items():
+                samples[endpoint].extend(values)
+            for endpoint, count in local_errors.items():
+                errors[endpoint] += count
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(0)
+    else:
+        threads = [
+            threading.Thread(target=worker, args=(index,))
+            for index in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall_time = time.perf_counter() - started
+    return build_report(samples, errors, wall_time, concurrency, iterations)
+
+
+def build_report(samples, errors, wall_time, concurrency, iterations):
+    endpoints = {}
+    total = 0
+    for endpoint, values in sorted(samples.items()):
+        latencies = sorted(value[0] * 1000 for value in values)
+        total += len(values)
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": errors.get(endpoint, 0),
+            "throughput_rps": round(len(values) / wall_time, 2),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "max": round(latencies[-1], 3),
+            },
+            "sql_queries_per_request": round(
+                sum(value[1] for value in values) / len(values), 2
+            ),
+            "sql_ms_per_request": round(
+                sum(value[2] for value in values) * 1000 / len(values), 3
+            ),
+        }
+    return {
+        "concurrency": concurrency,
+        "iterations_per_user": iterations,
+        "wall_time_s": round(wall_time, 3),
+        "requests": total,
+        "throughput_rps": round(total / wall_time, 2) if wall_time else None,
+        "endpoints": endpoints,
+    }
+
+
+def serialization_benchmark(messages=10000, repeat=5):
+    """Time rendering a history page of ``messages`` rows the old way, dicts
+    renamed per row and DRF's JSON renderer, against the tuple rows and fast
+    renderers. Reports the best of ``repeat`` runs and the payload size."""
+    now = timezone.now()
+    rows = [
+        (pk, now, f"benchmark message {pk}", f"bench{pk % 100}")
+        for pk in range(messages)
+    ]
+
+    def legacy():
+        block = []
+        for pk, timestamp, text, sender in rows:
+            message = {
+                "id": pk,
+                "timestamp": timestamp,
+                "text": text,
+                "sender__username": sender,
+            }
+            message["sender"] = message.pop("sender__username")
+            block.append(message)
+        return JSONRenderer().render({"messages": block})
+
+    def fast_rows():
+        return FastJSONRenderer().render(
+            {"messages": [dict(zip(MESSAGE_COLUMNS, row)) for row in rows]}
+        )
+
+    def fast_columns():
+        return FastJSONRenderer().render({"columns": MESSAGE_COLUMNS, "rows": rows})
+
+    def msgpack_columns():
+        return MessagePackRenderer().render({"columns": MESSAGE_COLUMNS, "rows": rows})
+
+    cases = {
+        "drf_json_dict_rows": legacy,
+        "fast_json_dict_rows": fast_rows,
+        "fast_json_columns": fast_columns,
+    }
+    if msgpack is not None:
+        cases["msgpack_columns"] = msgpack_columns
+    results = {}
+    for name, case in cases.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            payload = case()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "ms": round(min(timings) * 1000, 3),
+            "bytes": len(payload),
+        }
+    return {
+        "messages": messages,
+        "repeat": repeat,
+        "orjson": orjson is not None,
+        "results": results,
+    }
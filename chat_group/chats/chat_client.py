@@ -1,5 +1,24 @@
+from django.contrib.auth import get_user_model
+from model_mommy import mommy
 from rest_framework.test import APIClient
 
+User = get_user_model()
+
+
+def make_user(username, password=None, **fields):
+    """Create a user who can log in with ``password``, the username by
+    default."""
+    user = mommy.make(User, username=username, **fields)
+    user.set_password(password or username)
+    user.save()
+    return user
+
+
+def logged_in_client(username, password=None):
+    client = ChatTestApiClient(username, password or username)
+    client.login()
+    return client
+
 
 class ChatTestApiClient:
     def __init__(self, username, password):
@@ -25,6 +44,14 @@ class ChatTestApiClient:
     def get_user(self, user_id=""):
         return self.client.get(f"/api/v1/users/{user_id}")
 
+    def get_users(self, **params):
+        return self.client.get("/api/v1/users/", data=params)
+
+    def lookup_users(self, usernames):
+        return self.client.get(
+            "/api/v1/users/", data={"usernames": ",".join(usernames)}
+        )
+
     def create_user(self, username, is_superuser=False):
         data = {
             "username": username,
@@ -63,23 +90,69 @@ class ChatTestApiClient:
         response = self.client.delete(f"/api/v1/chatgroups/{id}")
         return response
 
+    def get_members(self, id, **params):
+        return self.client.get(f"/api/v1/chatgroups/{id}/members/", data=params)
+
     def add_members(self, id, usernames):
         data = {"members": usernames}
         response = self.client.post(f"/api/v1/chatgroups/{id}/members/", data=data)
         return response
 
     def remove_members(self, id, usernames):
-        data = {"memebers": usernames}
+        data = {"members": usernames}
         response = self.client.delete(f"/api/v1/chatgroups/{id}/members/", data=data)
         return response
 
-    def get_messages(self, group_id):
-        response = self.client.get(f"/api/v1/chatgroups/{id}/messages/")
+    def get_messages(self, group_id, if_none_match=None, **params):
+        headers = {}
+        if if_none_match is not None:
+            headers["HTTP_IF_NONE_MATCH"] = if_none_match
+        response = self.client.get(
+            f"/api/v1/chatgroups/{group_id}/messages/", data=params, **headers
+        )
+        return response
+
+    def poll_messages(self, group_id, after_id, **params):
+        response = self.client.get(
+            f"/api/v1/chatgroups/{group_id}/messages/",
+            data={"after_id": after_id, **params},
+        )
+        return response
+
+    def mark_read(self, group_id, message_id):
+        data = {"message_id": message_id}
+        response = self.client.post(f"/api/v1/chatgroups/{group_id}/read/", data=data)
+        return response
+
+    def get_unread(self):
+        return self.client.get("/api/v1/chatgroups/unread/")
+
+    def search_messages(self, group_id, q, **params):
+        response = self.client.get(
+            f"/api/v1/chatgroups/{group_id}/search/", data={"q": q, **params}
+        )
         return response
 
-    def post_message(self, text, group):
+    def export_messages(self, group_id, gzip=False, **params):
+        if gzip:
+            params["gzip"] = "true"
+        response = self.client.get(
+            f"/api/v1/chatgroups/{group_id}/export/", data=params
+        )
+        return response
+
+    def post_message(self, text, group, idempotency_key=None):
         data = {"text": text, "group": group}
-        response = self.client.post(f"/api/v1/messages/", data=data)
+        headers = {}
+        if idempotency_key is not None:
+            headers["HTTP_IDEMPOTENCY_KEY"] = idempotency_key
+        response = self.client.post(f"/api/v1/messages/", data=data, **headers)
+        return response
+
+    def post_messages_bulk(self, messages):
+        response = self.client.post(
+            "/api/v1/messages/bulk", data={"messages": messages}, format="json"
+        )
         return response
 
     def edit_message(self, id, text):
@@ -110,3 +183,18 @@ class ChatTestApiClient:
     def get_all_likes_on_message(self, id):
         response = self.client.get(f"/api/v1/messages/{id}/status/")
         return response
+
+    def react_batch(self, reactions):
+        response = self.client.post(
+            "/api/v1/messages/reactions", data={"reactions": reactions}, format="json"
+        )
+        return response
+
+    def get_reaction_summary(self, id, if_none_match=None):
+        headers = {}
+        if if_none_match is not None:
+            headers["HTTP_IF_NONE_MATCH"] = if_none_match
+        response = self.client.get(
+            f"/api/v1/messages/{id}/status/", data={"summary": "true"}, **headers
+        )
+        return response
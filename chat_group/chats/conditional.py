@@ -0,0 +1,125 @@
+import hashlib
+import threading
+
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from chat_group.caching import LocalTTLCache
+from chats.models import ChatGroup, Message, UsernameVersion
+from chats.pubsub import get_broker
+
+USERNAMES_CHANNEL = "chats.usernames"
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+class UsernamesVersion:
+    """Per-process copy of the ``UsernameVersion`` counter, dropped in every
+    process subscribed to ``broker`` when a rename commits and re-read after
+    ``ttl`` seconds otherwise."""
+
+    def __init__(self, broker, ttl=60):
+        self.local = LocalTTLCache(max_entries=1, ttl=ttl)
+        self.broker = broker
+        self.subscription = broker.subscribe([USERNAMES_CHANNEL], self._drop_local)
+
+    def get(self):
+        version = self.local.get("version")
+        if version is None:
+            version = (
+                UsernameVersion.objects.filter(pk=1)
+                .values_list("version", flat=True)
+                .first()
+            ) or 0
+            self.local.set("version", version)
+        return version
+
+    def bump(self):
+        """Count a rename in the current transaction."""
+        using = router.db_for_write(UsernameVersion)
+        versions = UsernameVersion.objects.using(using)
+        if not versions.filter(pk=1).update(version=F("version") + 1):
+            versions.get_or_create(pk=1, defaults={"version": 1})
+        transaction.on_commit(self._publish, using=using)
+
+    def _publish(self):
+        self._drop_local()
+        self.broker.publish(USERNAMES_CHANNEL, {"type": "usernames.changed"})
+
+    def _drop_local(self, event=None):
+        self.local.delete("version")
+
+    def close(self):
+        self.subscription.close()
+
+
+_usernames_version = None
+_usernames_version_lock = threading.Lock()
+
+
+def get_usernames_version():
+    global _usernames_version
+    if _usernames_version is None:
+        with _usernames_version_lock:
+            if _usernames_version is None:
+                _usernames_version = UsernamesVersion(get_broker())
+    return _usernames_version
+
+
+@receiver(setting_changed)
+def reset_usernames_version(*, setting, **kwargs):
+    global _usernames_version
+    if setting == "CHAT_PUBSUB" and _usernames_version is not None:
+        _usernames_version.close()
+        _usernames_version = None
+
+
+def group_history_etag(group_id, query_string=""):
+    """Validator of a history page, the group's newest id and timestamp and
+    the usernames version, as messages show their sender's name.
+
+    The ids come from index probes in one query, edits bump ``timestamp`` so
+    they change it as well.
+    """
+    messages = Message.objects.filter(group=OuterRef("pk"))
+    row = (
+        ChatGroup.objects.filter(pk=group_id)
+        .annotate(
+            last_id=Subquery(messages.order_by("-id").values("id")[:1]),
+            last_timestamp=Subquery(
+                messages.order_by("-timestamp", "-id").values("timestamp")[:1]
+            ),
+        )
+        .values_list("last_id", "last_timestamp")
+        .first()
+    )
+    if row is None:
+        return None
+    usernames = get_usernames_version().get()
+    return make_etag("history", group_id, *row, usernames, query_string)
+
+
+def reaction_etag(message_id, version, query_string=""):
+    """Validator of a message's reactions, ``version`` of its counter row,
+    ``None`` before the first reaction."""
+    return make_etag("reactions", message_id, version or 0, query_string)
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the client's copy matches ``etag``."""
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def set_validator(response, etag):
+    if etag is not None:
+        response["ETag"] = etag
+        # clients and proxies may keep the payload but must revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
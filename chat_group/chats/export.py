@@ -0,0 +1,81 @@
+import itertools
+import zlib
+
+from django.conf import settings
+
+from chats.archive import iter_archived_rows
+from chats.constants import SERIALIZER_STATUS_CHOICES
+from chats.models import Message
+from chats.renderers import dumps
+from chats.reactions import count_field
+
+EXPORT_FIELDS = ("id", "sender__username", "timestamp", "text")
+REACTION_FIELDS = tuple(
+    f"reaction_counts__{count_field(status)}" for status in SERIALIZER_STATUS_CHOICES
+)
+
+
+EXPORT_COLUMNS = ("id", "sender", "timestamp", "text", *SERIALIZER_STATUS_CHOICES)
+
+
+def iter_group_rows(group_id, chunk_size=None):
+    """Yield every message of the group oldest first as an ``EXPORT_COLUMNS``
+    tuple, archived segments one at a time and then hot rows from a
+    server-side cursor, so memory use does not grow with the history."""
+    for row in iter_archived_rows(group_id):
+        yield (
+            row["id"],
+            row["sender__username"],
+            row["timestamp"],
+            row["text"],
+            *(row["reactions"][status] for status in SERIALIZER_STATUS_CHOICES),
+        )
+    rows = (
+        Message.objects.filter(group_id=group_id)
+        .order_by("timestamp", "id")
+        .values_list(*EXPORT_FIELDS, *REACTION_FIELDS)
+        .iterator(chunk_size=chunk_size or settings.CHAT_EXPORT_CHUNK_SIZE)
+    )
+    for pk, sender, timestamp, text, *reactions in rows:
+        yield (pk, sender, timestamp, text, *(count or 0 for count in reactions))
+
+
+def iter_group_messages(group_id, chunk_size=None):
+    for pk, sender, timestamp, text, *reactions in iter_group_rows(
+        group_id, chunk_size
+    ):
+        yield {
+            "id": pk,
+            "sender": sender,
+            "timestamp": timestamp,
+            "text": text,
+            "reactions": dict(zip(SERIALIZER_STATUS_CHOICES, reactions)),
+        }
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield dumps(record) + b"\n"
+
+
+def iter_gzip(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_group(group_id, compress=False, chunk_size=None, columns=False):
+    """NDJSON export of the group, one object per message or, with
+    ``columns``, a ``{"columns": [...]}`` header followed by one array per
+    message."""
+    if columns:
+        records = itertools.chain(
+            [{"columns": EXPORT_COLUMNS}], iter_group_rows(group_id, chunk_size)
+        )
+    else:
+        records = iter_group_messages(group_id, chunk_size=chunk_size)
+    stream = iter_ndjson(records)
+    return iter_gzip(stream) if compress else stream
@@ -0,0 +1,9 @@
+from django.db.models import IntegerField, Subquery
+
+
+class SubqueryCount(Subquery):
+    """``COUNT(*)`` over a correlated subquery, which may be sliced to cap
+    how many rows the database has to visit."""
+
+    template = "(SELECT COUNT(*) FROM (%(subquery)s) _counted)"
+    output_field = IntegerField()
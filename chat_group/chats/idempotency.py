@@ -0,0 +1,105 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from chat_group.caching import LocalTTLCache
+
+PENDING = "pending"
+
+
+def request_fingerprint(*parts):
+    return hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Remembers the response of a write per ``(user, key)`` for ``ttl``
+    seconds so retried requests are answered without redoing the write.
+
+    ``begin`` atomically claims a key, a claim that is never completed, e.g.
+    because the worker died, expires after ``pending_ttl``. With
+    ``shared_cache`` the claim goes through ``cache.add`` so concurrent
+    retries hitting different processes are deduplicated too.
+    """
+
+    key_prefix = "chats:idempotency:"
+
+    def __init__(
+        self, max_entries=100000, ttl=86400, pending_ttl=30, shared_cache=None
+    ):
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.local = LocalTTLCache(max_entries=max_entries, ttl=ttl)
+        self.shared = caches[shared_cache] if shared_cache else None
+        self._lock = threading.Lock()
+
+    def _key(self, user_id, key):
+        return f"{self.key_prefix}{user_id}:{key}"
+
+    def begin(self, user_id, key, fingerprint):
+        """Claim the key and return None, or return the entry recorded by an
+        earlier request: ``{"state", "fingerprint", "status", "data"}``."""
+        cache_key = self._key(user_id, key)
+        pending = {"state": PENDING, "fingerprint": fingerprint}
+        with self._lock:
+            entry = self.local.get(cache_key)
+            if entry is not None:
+                return entry
+            if self.shared is not None and not self.shared.add(
+                cache_key, pending, self.pending_ttl
+            ):
+                entry = self.shared.get(cache_key)
+                if entry is not None:
+                    if entry["state"] != PENDING:
+                        self.local.set(cache_key, entry)
+                    return entry
+            self.local.set(cache_key, pending, self.pending_ttl)
+        return None
+
+    def complete(self, user_id, key, fingerprint, status, data):
+        cache_key = self._key(user_id, key)
+        entry = {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status": status,
+            "data": data,
+        }
+        self.local.set(cache_key, entry)
+        if self.shared is not None:
+            self.shared.set(cache_key, entry, self.ttl)
+
+    def release(self, user_id, key):
+        """Forget a claim whose request failed so the client can retry."""
+        cache_key = self._key(user_id, key)
+        self.local.delete(cache_key)
+        if self.shared is not None:
+            self.shared.delete(cache_key)
+
+
+_idempotency_store = None
+_idempotency_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    global _idempotency_store
+    if _idempotency_store is None:
+        with _idempotency_store_lock:
+            if _idempotency_store is None:
+                config = settings.CHAT_IDEMPOTENCY
+                _idempotency_store = IdempotencyStore(
+                    max_entries=config.get("MAX_ENTRIES", 100000),
+                    ttl=config.get("TTL", 86400),
+                    pending_ttl=config.get("PENDING_TTL", 30),
+                    shared_cache=config.get("SHARED_CACHE"),
+                )
+    return _idempotency_store
+
+
+@receiver(setting_changed)
+def reset_idempotency_store(*, setting, **kwargs):
+    global _idempotency_store
+    if setting == "CHAT_IDEMPOTENCY":
+        _idempotency_store = None
@@ -0,0 +1,217 @@
+import asyncio
+import io
+import math
+import re
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from chat_group.metrics import QueryCounter, counting_queries, registry
+from chat_group.routers import bind_request
+from chat_group.throttling import TokenBucketThrottle, get_throttling
+from chats.membership import get_membership_cache
+from chats.models import Message
+from chats.pagination import get_page_size
+from chats.pubsub import get_broker, group_channel
+from chats.realtime import authenticate
+from chats.renderers import MESSAGE_COLUMNS, dumps
+from chats.sharding import shard_for_group, use_shard
+
+LONG_POLL_PATH = re.compile(r"^/api/v1/chatgroups/(?P<group_id>\d+)/messages/?$")
+# the route of the history view, which the metrics report long-polls under
+LONG_POLL_ROUTE = "chatgroups-messages"
+THROTTLE_SCOPE = "longpoll"
+WAKEUP_EVENTS = ("message.created", "messages.imported")
+
+
+def messages_after(group_id, after_id, limit):
+    """Return the group's messages newer than ``after_id``, oldest first, and
+    whether more than ``limit`` of them exist."""
+    rows = list(
+        Message.objects.filter(group_id=group_id, id__gt=after_id)
+        .order_by("id")
+        .values_list("id", "timestamp", "text", "sender__username")[: limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "messages": [dict(zip(MESSAGE_COLUMNS, row)) for row in rows],
+        "last_id": rows[-1][0] if rows else after_id,
+        "has_more": has_more,
+    }
+
+
+def is_long_poll(scope):
+    return (
+        scope["type"] == "http"
+        and scope["method"] == "GET"
+        and LONG_POLL_PATH.match(scope["path"]) is not None
+        and "wait" in parse_qs(scope.get("query_string", b"").decode())
+    )
+
+
+def _parse_int(query, name, default=None):
+    value = query.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be an integer.")
+
+
+@sync_to_async
+def _load(request, group_id, after_id, limit, counter):
+    close_old_connections()
+    # routed and counted like the reads of the history view
+    with counting_queries(counter), bind_request(request):
+        if not get_membership_cache().is_member(group_id, request.user.pk):
+            return None
+        with use_shard(shard_for_group(group_id)):
+            return messages_after(group_id, after_id, limit)
+
+
+async def _respond(send, status, data, headers=()):
+    body = dumps(data)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _throttle_wait(request):
+    identities = {
+        "user": str(request.user.pk),
+        "ip": TokenBucketThrottle().get_ident(request),
+    }
+    # a shared bucket store is a network round trip
+    return await sync_to_async(get_throttling().check, thread_sensitive=False)(
+        THROTTLE_SCOPE, identities
+    )
+
+
+async def receive_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def long_poll_application(scope, receive, send):
+    """Serves ``GET /api/v1/chatgroups/<id>/messages/?after_id=&wait=``.
+
+    Answers at once when the group has messages newer than ``after_id``,
+    otherwise parks on the group's pub/sub channel, which message creation
+    publishes to, for up to ``wait`` seconds. Waiting clients hold no
+    thread, only a subscription and a coroutine.
+
+    Bypassing Django's middleware, it records the history view's metrics,
+    routes its reads like the view's and applies the ``longpoll`` throttle
+    itself.
+    """
+    counter = QueryCounter()
+    response_status, size = None, 0
+
+    async def observed_send(event):
+        nonlocal response_status, size
+        if event["type"] == "http.response.start":
+            response_status = event["status"]
+        else:
+            size += len(event.get("body", b""))
+        await send(event)
+
+    start = time.perf_counter()
+    try:
+        await _long_poll(scope, receive, observed_send, counter)
+    finally:
+        if response_status is not None:
+            registry.observe(
+                LONG_POLL_ROUTE,
+                scope["method"],
+                response_status,
+                time.perf_counter() - start,
+                counter.queries,
+                counter.seconds,
+                size,
+            )
+
+
+async def _long_poll(scope, receive, send, counter):
+    group_id = int(LONG_POLL_PATH.match(scope["path"]).group("group_id"))
+    http_request = ASGIRequest(scope, io.BytesIO())
+    request = Request(http_request)
+
+    user = await authenticate(scope)
+    if user is None:
+        return await _respond(send, 401, {"detail": "Authentication required."})
+    # sets the user of http_request as well
+    request.user = user
+    throttled = await _throttle_wait(request)
+    if throttled:
+        seconds = math.ceil(throttled)
+        return await _respond(
+            send,
+            429,
+            {
+                "detail": f"Request was throttled. Expected available in {seconds} seconds."
+            },
+            headers=[(b"retry-after", str(seconds).encode())],
+        )
+    try:
+        after_id = _parse_int(request.query_params, "after_id", 0)
+        wait = _parse_int(request.query_params, "wait", 0)
+        limit = get_page_size(request)
+    except ValidationError as error:
+        return await _respond(send, 400, error.detail)
+    wait = max(0, min(wait, settings.CHAT_LONG_POLL_MAX_WAIT))
+
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+
+    def wake(event):
+        if event.get("type") in WAKEUP_EVENTS:
+            loop.call_soon_threadsafe(woken.set)
+
+    # subscribe before the first read so no message slips in between
+    subscription = await sync_to_async(get_broker().subscribe, thread_sensitive=False)(
+        [group_channel(group_id)], wake
+    )
+    disconnected = asyncio.ensure_future(receive_disconnect(receive))
+    try:
+        deadline = loop.time() + wait
+        while True:
+            woken.clear()
+            page = await _load(http_request, group_id, after_id, limit, counter)
+            if page is None:
+                return await _respond(
+                    send, 401, {"detail": "Only Members of the group can read messages"}
+                )
+            remaining = deadline - loop.time()
+            if page["messages"] or remaining <= 0:
+                return await _respond(send, 200, page)
+            waiter = asyncio.ensure_future(woken.wait())
+            done, _ = await asyncio.wait(
+                {waiter, disconnected},
+                timeout=remaining,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            waiter.cancel()
+            if disconnected in done:
+                return
+    finally:
+        disconnected.cancel()
+        await sync_to_async(subscription.close, thread_sensitive=False)()
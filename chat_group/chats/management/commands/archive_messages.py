@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chats.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = "Move old messages into compressed per group archive segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=float,
+            default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+            help="Archive messages older than this many days.",
+        )
+        parser.add_argument(
+            "--window-hours",
+            type=float,
+            default=settings.CHAT_ARCHIVE_WINDOW_HOURS,
+            help="Time span covered by one segment.",
+        )
+        parser.add_argument(
+            "--group", type=int, action="append", dest="groups", help="Group id."
+        )
+
+    def handle(self, older_than_days, window_hours, groups=None, **options):
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        archived = archive_messages(cutoff, int(window_hours * 3600), group_ids=groups)
+        for group_id, count in archived.items():
+            self.stdout.write(f"group {group_id}: archived {count} messages")
+        self.stdout.write(f"archived {sum(archived.values())} messages")
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from chats import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed benchmark data and drive concurrent simulated users through the "
+        "API, reporting latency percentiles, throughput and SQL use as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--groups", type=int, default=5)
+        parser.add_argument("--members-per-group", type=int, default=10)
+        parser.add_argument("--messages", type=int, default=1000)
+        parser.add_argument("--reactions", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--mix",
+            default=None,
+            help='Operation weights as JSON, e.g. \'{"post": 1, "read": 9}\'.',
+        )
+        parser.add_argument(
+            "--serialization",
+            type=int,
+            metavar="ROWS",
+            help="Only time rendering a history page of ROWS messages.",
+        )
+        parser.add_argument("--output", "-o", help="Write the report to a file.")
+        parser.add_argument(
+            "--use-current-db",
+            action="store_true",
+            help=(
+                "Seed into the configured database instead of a throwaway one, "
+                "data seeded by earlier runs is reused."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["serialization"]:
+            report = benchmark.serialization_benchmark(options["serialization"])
+            return self.write_report(report, options["output"])
+        old_config = None
+        if not options["use_current_db"]:
+            default = settings.DATABASES["default"]
+            if default["ENGINE"].endswith("sqlite3"):
+                # a file, unlike the shared in-memory test db, lets the
+                # simulated users write concurrently
+                test_settings = default.setdefault("TEST", {})
+                test_settings["NAME"] = os.path.join(
+                    tempfile.mkdtemp(), "benchmark.sqlite3"
+                )
+            old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            dataset = benchmark.seed(
+                users=options["users"],
+                groups=options["groups"],
+                members_per_group=options["members_per_group"],
+                messages=options["messages"],
+                reactions=options["reactions"],
+            )
+            report = benchmark.run(
+                dataset,
+                concurrency=options["concurrency"],
+                iterations=options["iterations"],
+                mix=json.loads(options["mix"]) if options["mix"] else None,
+            )
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+        self.write_report(report, options["output"])
+
+    def write_report(self, report, path=None):
+        output = json.dumps(report, indent=2)
+        if path:
+            with open(path, "w") as report_file:
+                report_file.write(output)
+        else:
+            self.stdout.write(output)
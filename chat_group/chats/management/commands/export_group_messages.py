@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.export import export_group
+from chats.models import ChatGroup
+from chats.sharding import shard_for_group, use_shard
+
+
+class Command(BaseCommand):
+    help = "Export the full message history of a group as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("group_id", type=int)
+        parser.add_argument(
+            "--output", "-o", help="File to write to, defaults to stdout."
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Gzip compress the output."
+        )
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, group_id, output=None, gzip=False, chunk_size=None, **options):
+        with use_shard(shard_for_group(group_id)):
+            self.export(group_id, output, gzip, chunk_size)
+
+    def export(self, group_id, output, gzip, chunk_size):
+        if not ChatGroup.objects.filter(pk=group_id).exists():
+            raise CommandError(f"Chat group {group_id} does not exist.")
+        stream = open(output, "wb") if output else sys.stdout.buffer
+        try:
+            for chunk in export_group(group_id, compress=gzip, chunk_size=chunk_size):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
+            else:
+                stream.flush()
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.models import ChatGroup
+from chats.sharding import (
+    GroupMoveConflict,
+    move_group,
+    replicate_users,
+    shard_aliases,
+    shard_for_group,
+)
+
+
+class Command(BaseCommand):
+    help = "Move chat groups between shards and replicate users to the shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--move",
+            nargs=2,
+            action="append",
+            default=[],
+            metavar=("GROUP_ID", "SHARD"),
+            help="Move a group with its messages to another shard.",
+        )
+        parser.add_argument(
+            "--sync-users",
+            action="store_true",
+            help="Copy every user to the shards, e.g. after bulk inserts.",
+        )
+
+    def handle(self, move, sync_users=False, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("Sharding is disabled, CHAT_SHARDING lists no shards.")
+        if sync_users:
+            replicate_users()
+            self.stdout.write(f"replicated users to {', '.join(aliases)}")
+        for group_id, target in move:
+            if target not in aliases:
+                raise CommandError(f"Unknown shard {target}.")
+            source = shard_for_group(group_id)
+            if source is None:
+                raise CommandError(f"Invalid group id {group_id}.")
+            try:
+                copied = move_group(int(group_id), target)
+            except (ChatGroup.DoesNotExist, GroupMoveConflict) as error:
+                raise CommandError(str(error))
+            if not copied:
+                self.stdout.write(f"group {group_id}: already on {target}")
+                continue
+            self.stdout.write(
+                f"group {group_id}: moved from {source} to {target}, "
+                + ", ".join(f"{count} {name}" for name, count in copied.items())
+            )
@@ -0,0 +1,129 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from chat_group.caching import LocalTTLCache
+from chats.models import ChatGroup
+from chats.pubsub import get_broker
+from chats.sharding import shard_for_group
+
+INVALIDATION_CHANNEL = "chats.membership"
+
+
+class MembershipCache:
+    """Maps a group id to the frozen set of its member ids.
+
+    Lookups go to a per-process LRU+TTL tier first, then to the optional
+    shared Django cache and finally to the membership table. Entries are
+    dropped by the ``m2m_changed``/``post_delete`` handlers in
+    ``chats.signals`` and, with a ``broker``, in the local tier of every
+    process subscribed to it. The TTL bounds staleness for anything missed.
+    """
+
+    key_prefix = "chats:members:"
+
+    def __init__(self, max_entries=10000, ttl=60, shared_cache=None, broker=None):
+        self.ttl = ttl
+        self.local = LocalTTLCache(max_entries=max_entries, ttl=ttl)
+        self.shared = caches[shared_cache] if shared_cache else None
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.broker = broker
+        self.subscription = None
+        if broker is not None:
+            self.subscription = broker.subscribe(
+                [INVALIDATION_CHANNEL], self._drop_local
+            )
+
+    def get_member_ids(self, group_id):
+        group_id = int(group_id)
+        member_ids = self.local.get(group_id)
+        if member_ids is not None:
+            return member_ids
+        key = f"{self.key_prefix}{group_id}"
+        if self.shared is not None:
+            member_ids = self.shared.get(key)
+            if member_ids is not None:
+                self.shared_hits += 1
+                self.local.set(group_id, member_ids)
+                return member_ids
+            self.shared_misses += 1
+        member_ids = frozenset(
+            ChatGroup.members.through.objects.using(shard_for_group(group_id))
+            .filter(chatgroup_id=group_id)
+            .values_list("user_id", flat=True)
+        )
+        self.local.set(group_id, member_ids)
+        if self.shared is not None:
+            self.shared.set(key, member_ids, self.ttl)
+        return member_ids
+
+    def is_member(self, group_id, user_id):
+        return user_id in self.get_member_ids(group_id)
+
+    def invalidate(self, *group_ids):
+        self._drop_local({"groups": group_ids})
+        if self.shared is not None:
+            self.shared.delete_many([f"{self.key_prefix}{pk}" for pk in group_ids])
+        if self.broker is not None:
+            self.broker.publish(
+                INVALIDATION_CHANNEL,
+                {"type": "membership.invalidated", "groups": list(group_ids)},
+            )
+
+    def _drop_local(self, event):
+        for group_id in event["groups"]:
+            self.local.delete(int(group_id))
+
+    def close(self):
+        if self.subscription is not None:
+            self.subscription.close()
+
+    def invalidate_on_commit(self, *group_ids, using=None):
+        """Drop the entries now and again once the transaction commits, so a
+        concurrent reader cannot keep the pre-commit membership cached."""
+        self.invalidate(*group_ids)
+        transaction.on_commit(lambda: self.invalidate(*group_ids), using=using)
+
+    def stats(self):
+        return {
+            "local_hits": self.local.hits,
+            "local_misses": self.local.misses,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "entries": len(self.local),
+        }
+
+
+_membership_cache = None
+_membership_cache_lock = threading.Lock()
+
+
+def get_membership_cache():
+    global _membership_cache
+    if _membership_cache is None:
+        with _membership_cache_lock:
+            if _membership_cache is None:
+                config = settings.CHAT_MEMBERSHIP_CACHE
+                _membership_cache = MembershipCache(
+                    max_entries=config.get("MAX_ENTRIES", 10000),
+                    ttl=config.get("TTL", 60),
+                    shared_cache=config.get("SHARED_CACHE"),
+                    broker=get_broker(),
+                )
+    return _membership_cache
+
+
+@receiver(setting_changed)
+def reset_membership_cache(*, setting, **kwargs):
+    global _membership_cache
+    # a new broker needs a new subscription as well
+    if setting not in ("CHAT_MEMBERSHIP_CACHE", "CHAT_PUBSUB"):
+        return
+    if _membership_cache is not None:
+        _membership_cache.close()
+    _membership_cache = None
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="messagestatus",
+            name="message",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="statuses",
+                to="chats.message",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["group", "timestamp", "id"], name="chats_msg_group_ts_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_reaction_counts(apps, schema_editor):
+    MessageStatus = apps.get_model("chats", "MessageStatus")
+    MessageReactionCount = apps.get_model("chats", "MessageReactionCount")
+    db_alias = schema_editor.connection.alias
+    counters = {}
+    rows = (
+        MessageStatus.objects.using(db_alias)
+        .values("message_id", "status")
+        .annotate(total=models.Count("id"))
+    )
+    for row in rows:
+        counter = counters.setdefault(
+            row["message_id"], MessageReactionCount(message_id=row["message_id"])
+        )
+        setattr(counter, f"{row['status']}_count", row["total"])
+    MessageReactionCount.objects.using(db_alias).bulk_create(
+        counters.values(), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0002_message_group_timestamp_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageReactionCount",
+            fields=[
+                (
+                    "message",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="reaction_counts",
+                        serialize=False,
+                        to="chats.message",
+                    ),
+                ),
+                ("like_count", models.PositiveIntegerField(default=0)),
+                ("dislike_count", models.PositiveIntegerField(default=0)),
+                ("heart_count", models.PositiveIntegerField(default=0)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_reaction_counts, migrations.RunPython.noop),
+    ]
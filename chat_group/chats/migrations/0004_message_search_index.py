@@ -0,0 +1,66 @@
+from django.db import migrations
+
+FTS_TABLE = "chats_message_fts"
+INDEX_NAME = "chats_message_text_fts"
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='chats_message', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS chats_message_fts_insert
+    AFTER INSERT ON chats_message BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chats_message_fts_delete
+    AFTER DELETE ON chats_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chats_message_fts_update
+    AFTER UPDATE OF text ON chats_message BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS chats_message_fts_insert",
+    "DROP TRIGGER IF EXISTS chats_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_message_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+INSTALL = {
+    "sqlite": SQLITE_SETUP,
+    "postgresql": [
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON chats_message "
+        "USING GIN (to_tsvector('simple', coalesce(text, '')))"
+    ],
+    "mysql": [f"CREATE FULLTEXT INDEX {INDEX_NAME} ON chats_message (text)"],
+}
+REMOVE = {
+    "sqlite": SQLITE_TEARDOWN,
+    "postgresql": [f"DROP INDEX IF EXISTS {INDEX_NAME}"],
+    "mysql": [f"DROP INDEX {INDEX_NAME} ON chats_message"],
+}
+
+
+def install(apps, schema_editor):
+    for statement in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def remove(apps, schema_editor):
+    for statement in REMOVE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0003_message_reaction_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chats", "0004_message_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReadMarker",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_read_message_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["group", "id"], name="chats_msg_group_id_idx"),
+        ),
+        migrations.AddField(
+            model_name="readmarker",
+            name="group",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="read_markers",
+                to="chats.chatgroup",
+            ),
+        ),
+        migrations.AddField(
+            model_name="readmarker",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="read_markers",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="readmarker",
+            constraint=models.UniqueConstraint(
+                fields=("user", "group"), name="chats_readmarker_user_group_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0005_read_marker"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageArchiveSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_timestamp", models.DateTimeField()),
+                ("first_message_id", models.BigIntegerField()),
+                ("last_timestamp", models.DateTimeField()),
+                ("last_message_id", models.BigIntegerField()),
+                ("message_count", models.PositiveIntegerField()),
+                ("payload", models.BinaryField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archive_segments",
+                        to="chats.chatgroup",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="messagearchivesegment",
+            index=models.Index(
+                fields=["group", "first_timestamp", "first_message_id"],
+                name="chats_archive_group_first_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="messagearchivesegment",
+            index=models.Index(
+                fields=["group", "last_timestamp", "last_message_id"],
+                name="chats_archive_group_last_idx",
+            ),
+        ),
+    ]
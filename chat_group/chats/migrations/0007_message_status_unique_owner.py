@@ -0,0 +1,54 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+def remove_duplicate_statuses(apps, schema_editor):
+    """Keep the newest reaction per message and owner and recount the
+    messages that had duplicates."""
+    MessageStatus = apps.get_model("chats", "MessageStatus")
+    MessageReactionCount = apps.get_model("chats", "MessageReactionCount")
+    statuses = MessageStatus.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        statuses.values("message_id", "owner_id")
+        .annotate(total=models.Count("id"), keep=models.Max("id"))
+        .filter(total__gt=1)
+    )
+    message_ids = set()
+    for row in duplicates:
+        statuses.filter(message_id=row["message_id"], owner_id=row["owner_id"]).exclude(
+            id=row["keep"]
+        ).delete()
+        message_ids.add(row["message_id"])
+    counters = MessageReactionCount.objects.using(schema_editor.connection.alias)
+    for message_id in message_ids:
+        counts = {
+            f"{row['status']}_count": row["total"]
+            for row in statuses.filter(message_id=message_id)
+            .values("status")
+            .annotate(total=models.Count("id"))
+        }
+        counters.filter(message_id=message_id).update(
+            like_count=counts.get("like_count", 0),
+            dislike_count=counts.get("dislike_count", 0),
+            heart_count=counts.get("heart_count", 0),
+            version=models.F("version") + 1,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0006_message_archive_segment"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_statuses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="messagestatus",
+            constraint=models.UniqueConstraint(
+                fields=("message", "owner"),
+                name="chats_messagestatus_message_owner_uniq",
+            ),
+        ),
+    ]
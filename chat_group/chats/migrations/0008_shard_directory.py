@@ -0,0 +1,43 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0007_message_status_unique_owner"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GroupPlacement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ShardIdBlock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.CharField(max_length=64)),
+            ],
+        ),
+    ]
@@ -1,10 +1,38 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Substr
 
 from chats.constants import STATUS_CHOICES
+from chats.expressions import SubqueryCount
 
 User = get_user_model()
 
+MESSAGE_PREVIEW_LENGTH = 100
+
+
+class ChatGroupQuerySet(models.QuerySet):
+    def summary(self):
+        """Annotate member count and the latest message with correlated
+        subqueries, each an index lookup, instead of joining the members."""
+        members = ChatGroup.members.through.objects.filter(
+            chatgroup_id=models.OuterRef("pk")
+        ).values("id")
+        last_message = Message.objects.filter(group=models.OuterRef("pk")).order_by(
+            "-timestamp", "-id"
+        )
+        return self.annotate(
+            member_count=SubqueryCount(members),
+            last_message_id=models.Subquery(last_message.values("id")[:1]),
+            last_message_preview=models.Subquery(
+                last_message.annotate(
+                    preview=Substr("text", 1, MESSAGE_PREVIEW_LENGTH)
+                ).values("preview")[:1]
+            ),
+            last_message_timestamp=models.Subquery(
+                last_message.values("timestamp")[:1]
+            ),
+        )
+
 
 class ChatGroup(models.Model):
     name = models.CharField(max_length=256)
@@ -13,6 +41,8 @@ class ChatGroup(models.Model):
     )
     members = models.ManyToManyField(User)
 
+    objects = ChatGroupQuerySet.as_manager()
+
 
 class Message(models.Model):
     group = models.ForeignKey(ChatGroup, on_delete=models.CASCADE)
@@ -20,6 +50,14 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now=True)
     text = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["group", "timestamp", "id"], name="chats_msg_group_ts_id_idx"
+            ),
+            models.Index(fields=["group", "id"], name="chats_msg_group_id_idx"),
+        ]
+
 
 class MessageStatus(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -27,3 +65,90 @@ class MessageStatus(models.Model):
     message = models.ForeignKey(
         Message, on_delete=models.CASCADE, related_name="statuses"
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["message", "owner"],
+                name="chats_messagestatus_message_owner_uniq",
+            ),
+        ]
+
+
+class MessageReactionCount(models.Model):
+    message = models.OneToOneField(
+        Message,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="reaction_counts",
+    )
+    like_count = models.PositiveIntegerField(default=0)
+    dislike_count = models.PositiveIntegerField(default=0)
+    heart_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveBigIntegerField(default=0)
+
+
+class ReadMarker(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="read_markers"
+    )
+    group = models.ForeignKey(
+        ChatGroup, on_delete=models.CASCADE, related_name="read_markers"
+    )
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "group"], name="chats_readmarker_user_group_uniq"
+            ),
+        ]
+
+
+class MessageArchiveSegment(models.Model):
+    """Compressed block of archived messages of one group and time window."""
+
+    group = models.ForeignKey(
+        ChatGroup, on_delete=models.CASCADE, related_name="archive_segments"
+    )
+    first_timestamp = models.DateTimeField()
+    first_message_id = models.BigIntegerField()
+    last_timestamp = models.DateTimeField()
+    last_message_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["group", "first_timestamp", "first_message_id"],
+                name="chats_archive_group_first_idx",
+            ),
+            models.Index(
+                fields=["group", "last_timestamp", "last_message_id"],
+                name="chats_archive_group_last_idx",
+            ),
+        ]
+
+
+class GroupPlacement(models.Model):
+    """Shard of a group when ``CHAT_SHARDING`` is enabled. Its id is the group
+    id, allocated here so ids stay unique over all shards. Kept on the
+    default database."""
+
+    shard = models.CharField(max_length=64)
+
+
+class UsernameVersion(models.Model):
+    """Number of user renames, part of the validators of representations
+    showing usernames. A single row, kept on the default database."""
+
+    version = models.PositiveBigIntegerField(default=0)
+
+
+class ShardIdBlock(models.Model):
+    """Range of ids ``[id << ID_BLOCK_BITS, (id + 1) << ID_BLOCK_BITS)`` the
+    sequences of a shard's tables hand out. Kept on the default database."""
+
+    shard = models.CharField(max_length=64)
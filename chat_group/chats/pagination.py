@@ -0,0 +1,122 @@
+import base64
+import binascii
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from chats.archive import archived_rows
+
+
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError("Invalid cursor.")
+    if timestamp is None:
+        raise ValidationError("Invalid cursor.")
+    return timestamp, pk
+
+
+def get_page_size(request, default=None, maximum=None):
+    limit = request.query_params.get("limit")
+    if limit is None:
+        return default or settings.CHAT_MESSAGES_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValidationError("limit must be an integer.")
+    if limit < 1:
+        raise ValidationError("limit must be positive.")
+    return min(limit, maximum or settings.CHAT_MESSAGES_MAX_PAGE_SIZE)
+
+
+class MessageKeysetPaginator:
+    """Keyset pagination over ``(timestamp, id)`` for a message queryset.
+
+    ``before`` walks towards older messages and ``after`` towards newer ones,
+    without either cursor the latest page is returned. Rows are
+    ``(id, timestamp, *fields)`` tuples, always oldest first.
+
+    With ``archive_group_id`` the archived segments of that group are merged
+    in, ``since`` then bounds the archived rows like a timestamp filter on
+    the queryset does for the hot ones.
+    """
+
+    def __init__(
+        self,
+        queryset,
+        limit,
+        before=None,
+        after=None,
+        archive_group_id=None,
+        since=None,
+    ):
+        if before and after:
+            raise ValidationError("Use either `before` or `after`, not both.")
+        self.queryset = queryset
+        self.limit = limit
+        self.before = decode_cursor(before) if before else None
+        self.after = decode_cursor(after) if after else None
+        self.archive_group_id = archive_group_id
+        self.since = since
+        # archived rows read for the last page, by id
+        self.archived = {}
+
+    def get_page(self, *fields):
+        queryset = self.queryset
+        if self.after:
+            timestamp, pk = self.after
+            queryset = queryset.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            ).order_by("timestamp", "id")
+        else:
+            if self.before:
+                timestamp, pk = self.before
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+                )
+            queryset = queryset.order_by("-timestamp", "-id")
+
+        columns = ("id", "timestamp", *fields)
+        rows = list(queryset.values_list(*columns)[: self.limit + 1])
+        if self.archive_group_id is not None:
+            # a full hot page leaves only segments beating its last row
+            edge = None
+            if len(rows) > self.limit:
+                edge = (rows[self.limit][1], rows[self.limit][0])
+            archived = archived_rows(
+                self.archive_group_id,
+                self.limit + 1,
+                before=self.before,
+                after=self.after,
+                since=self.since,
+                edge=edge,
+            )
+            self.archived = {row["id"]: row for row in archived}
+            rows.extend(tuple(row[column] for column in columns) for row in archived)
+            rows.sort(key=itemgetter(1, 0), reverse=not self.after)
+        has_more = len(rows) > self.limit
+        rows = rows[: self.limit]
+        if not self.after:
+            rows.reverse()
+
+        older = newer = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if self.after or has_more:
+                older = encode_cursor(first[1], first[0])
+            newer = encode_cursor(last[1], last[0])
+        elif self.after:
+            newer = encode_cursor(*self.after)
+        return rows, {"older": older, "newer": newer, "has_more": has_more}
@@ -0,0 +1,273 @@
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def group_channel(group_id):
+    return f"chatgroup.{group_id}"
+
+
+class Subscription:
+    def __init__(self, broker, channels, callback):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.callback = callback
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    """Fan-out of chat events to subscribers.
+
+    ``callback`` passed to :meth:`subscribe` is invoked with the decoded event
+    from whatever thread delivers it, so it must be cheap and thread safe.
+    """
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channels, callback):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessBroker(BaseBroker):
+    """Delivers events to subscribers living in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.callback(event)
+            except Exception:
+                logger.exception("Subscriber failed for channel %s", channel)
+
+    def subscribe(self, channels, callback):
+        subscription = Subscription(self, channels, callback)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        emptied = []
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[channel]
+                    emptied.append(channel)
+        return emptied
+
+    def channels(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+
+class RedisBroker(BaseBroker):
+    """Publishes through a redis compatible server so every node sees events.
+
+    A single listener thread per process owns the redis subscription, it
+    applies queued subscribe and unsubscribe commands between polls and
+    hands events to the local subscribers. :meth:`subscribe` blocks until
+    its channels are live, up to ``poll_timeout``, so async callers should
+    run it in a thread. When the connection fails the listener waits
+    ``reconnect_delay``, doubling up to ``max_reconnect_delay``, and
+    subscribes the active channels again once it is back.
+    """
+
+    poll_timeout = 0.5
+    reconnect_delay = 0.1
+    max_reconnect_delay = 5.0
+
+    def __init__(self, url="redis://localhost:6379/0", client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self._local = InProcessBroker()
+        self._lock = threading.Lock()
+        self._commands = queue.Queue()
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._listener = None
+        self._closed = threading.Event()
+
+    def publish(self, channel, event):
+        self.client.publish(channel, json.dumps(event, default=str))
+
+    def subscribe(self, channels, callback):
+        done = None
+        with self._lock:
+            # local state and queued commands change together so the
+            # listener applies them in the same order
+            known = self._local.channels()
+            subscription = self._local.subscribe(channels, callback)
+            new_channels = [c for c in subscription.channels if c not in known]
+            if new_channels:
+                done = self._send("subscribe", new_channels)
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="chat-pubsub", daemon=True
+                )
+                self._listener.start()
+        if done is not None:
+            done.wait(self.poll_timeout * 2)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            emptied = self._local.unsubscribe(subscription)
+            if emptied:
+                self._send("unsubscribe", emptied)
+        return emptied
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.join()
+        self._pubsub.close()
+
+    def _send(self, command, channels):
+        done = threading.Event()
+        self._commands.put((command, channels, done))
+        return done
+
+    def _apply_commands(self):
+        while True:
+            try:
+                command, channels, done = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                getattr(self._pubsub, command)(*channels)
+            except Exception:
+                logger.exception("Failed to %s %s", command, channels)
+            finally:
+                done.set()
+
+    def _resubscribe(self):
+        with self._lock:
+            channels = self._local.channels()
+        if channels:
+            self._pubsub.subscribe(*channels)
+
+    def _listen(self):
+        delay = None
+        while not self._closed.is_set():
+            try:
+                if delay is not None:
+                    self._resubscribe()
+                self._apply_commands()
+                message = self._pubsub.get_message(timeout=self.poll_timeout)
+            except Exception:
+                logger.exception("Lost redis pubsub connection")
+                delay = min(
+                    self.max_reconnect_delay,
+                    self.reconnect_delay if delay is None else delay * 2,
+                )
+                self._closed.wait(delay)
+                continue
+            delay = None
+            if message is None or message.get("type") != "message":
+                continue
+            channel, data = message["channel"], message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if isinstance(data, bytes):
+                data = data.decode()
+            self._local.publish(channel, json.loads(data))
+
+
+class LocalRedis:
+    """In-memory stand-in for the subset of the redis client used by
+    :class:`RedisBroker`, so several brokers can share one "server" in tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pubsubs = set()
+
+    def publish(self, channel, data):
+        with self._lock:
+            receivers = [p for p in self._pubsubs if channel in p.channels]
+        for pubsub in receivers:
+            pubsub._queue.put(
+                {"type": "message", "channel": channel.encode(), "data": data}
+            )
+        return len(receivers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        pubsub = LocalPubSub(self)
+        with self._lock:
+            self._pubsubs.add(pubsub)
+        return pubsub
+
+
+class LocalPubSub:
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self._queue = queue.Queue()
+
+    def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with self.server._lock:
+            self.server._pubsubs.discard(self)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = settings.CHAT_PUBSUB
+                backend = import_string(config["BACKEND"])
+                _broker = backend(**config.get("OPTIONS", {}))
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(*, setting, **kwargs):
+    global _broker
+    if setting == "CHAT_PUBSUB" and _broker is not None:
+        _broker.close()
+        _broker = None
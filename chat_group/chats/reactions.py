@@ -0,0 +1,200 @@
+import sqlite3
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import Case, Count, F, IntegerField, Max, Value, When
+
+from chats.constants import SERIALIZER_STATUS_CHOICES
+from chats.models import MessageReactionCount, MessageStatus
+
+
+def count_field(status):
+    return f"{status}_count"
+
+
+def get_reaction_summary(message_id):
+    counts = (
+        MessageReactionCount.objects.filter(message_id=message_id)
+        .values(*(count_field(status) for status in SERIALIZER_STATUS_CHOICES))
+        .first()
+    )
+    return {
+        status: counts[count_field(status)] if counts else 0
+        for status in SERIALIZER_STATUS_CHOICES
+    }
+
+
+def get_page_reactions(message_ids, user_id, archived=None):
+    """Return reaction counts by status and ``user_id``'s own reaction for a
+    page of messages.
+
+    Hot messages are counted with one grouped aggregate over their ids,
+    ``archived`` maps ids of archived messages to their segment rows, which
+    carry the counts and reactions already.
+    """
+    archived = archived or {}
+    summaries = {pk: dict.fromkeys(SERIALIZER_STATUS_CHOICES, 0) for pk in message_ids}
+    own = dict.fromkeys(message_ids)
+    hot_ids = [pk for pk in message_ids if pk not in archived]
+    if hot_ids:
+        rows = (
+            MessageStatus.objects.filter(message_id__in=hot_ids)
+            .order_by()
+            .values("message_id", "status")
+            .annotate(
+                total=Count("id"),
+                own=Max(
+                    Case(
+                        When(owner_id=user_id, then=Value(1)),
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                ),
+            )
+        )
+        for row in rows:
+            summaries[row["message_id"]][row["status"]] = row["total"]
+            if row["own"]:
+                own[row["message_id"]] = row["status"]
+    for pk in message_ids:
+        if pk in archived:
+            summaries[pk].update(archived[pk]["reactions"])
+            for owner_id, status in archived[pk]["statuses"]:
+                if owner_id == user_id:
+                    own[pk] = status
+    return summaries, own
+
+
+def _can_return_rows(connection):
+    if connection.vendor == "sqlite":
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return connection.vendor == "postgresql"
+
+
+def _upsert_sql(rows, vendor, returning=False):
+    table = MessageStatus._meta.db_table
+    values = ", ".join(["(%s, %s, %s)"] * rows)
+    sql = f"INSERT INTO {table} (message_id, owner_id, status) VALUES {values} "
+    if vendor == "mysql":
+        return sql + "ON DUPLICATE KEY UPDATE status = VALUES(status)"
+    sql += "ON CONFLICT (message_id, owner_id) DO UPDATE SET status = excluded.status"
+    return sql + " RETURNING message_id, id" if returning else sql
+
+
+def _lock_counters(message_ids, connection):
+    """Create the messages' missing counter rows and lock them all, in one
+    statement.
+
+    Being a write, this takes the row locks (or sqlite's write lock) first,
+    so concurrent changes to the same messages' reactions serialize before
+    the old statuses are read.
+    """
+    table = MessageReactionCount._meta.db_table
+    columns = ["message_id", "version"] + [
+        count_field(status) for status in SERIALIZER_STATUS_CHOICES
+    ]
+    row = "(%s" + ", 0" * (len(columns) - 1) + ")"
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES {', '.join([row] * len(message_ids))} "
+    )
+    if connection.vendor == "mysql":
+        sql += "ON DUPLICATE KEY UPDATE version = version"
+    else:
+        sql += f"ON CONFLICT (message_id) DO UPDATE SET version = {table}.version"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, message_ids)
+
+
+def apply_reactions(owner_id, changes, create=True):
+    """Set the owner's reactions to many messages at once.
+
+    ``changes`` maps a message id to its new status, ``None`` removes the
+    reaction. With ``create=False`` only existing reactions are changed.
+    Runs a fixed number of statements however many messages are touched:
+    one counter lock, one read, one upsert, one delete and one counter
+    update. Must be called in a transaction, returns the previous status per
+    message id.
+    """
+    return _apply_reactions(owner_id, changes, create)[0]
+
+
+def set_reaction(owner_id, message_id, status, create=True):
+    """``apply_reactions`` for one message, returns the previous status and
+    the id of the reaction row, ``None`` when there is none."""
+    previous, ids = _apply_reactions(
+        owner_id, {message_id: status}, create, with_ids=True
+    )
+    return previous[message_id], ids.get(message_id)
+
+
+def _apply_reactions(owner_id, changes, create, with_ids=False):
+    message_ids = sorted(changes)
+    if not message_ids:
+        return {}, {}
+    connection = connections[router.db_for_write(MessageStatus)]
+    _lock_counters(message_ids, connection)
+    previous = dict.fromkeys(message_ids)
+    ids = {}
+    for message_id, pk, status in MessageStatus.objects.filter(
+        message_id__in=message_ids, owner_id=owner_id
+    ).values_list("message_id", "id", "status"):
+        previous[message_id] = status
+        ids[message_id] = pk
+
+    upserts, removals = [], []
+    deltas = defaultdict(dict)
+    for message_id in message_ids:
+        old_status, new_status = previous[message_id], changes[message_id]
+        if old_status == new_status or (old_status is None and not create):
+            continue
+        if new_status is None:
+            removals.append(message_id)
+        else:
+            upserts.append((message_id, owner_id, new_status))
+            field = count_field(new_status)
+            deltas[field][message_id] = deltas[field].get(message_id, 0) + 1
+        if old_status is not None:
+            field = count_field(old_status)
+            deltas[field][message_id] = deltas[field].get(message_id, 0) - 1
+
+    if upserts:
+        returning = with_ids and _can_return_rows(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _upsert_sql(len(upserts), connection.vendor, returning),
+                [value for row in upserts for value in row],
+            )
+            if returning:
+                ids.update(cursor.fetchall())
+        if with_ids and not returning:
+            ids.update(
+                MessageStatus.objects.filter(
+                    message_id__in=[row[0] for row in upserts], owner_id=owner_id
+                ).values_list("message_id", "id")
+            )
+    if removals:
+        MessageStatus.objects.filter(
+            message_id__in=removals, owner_id=owner_id
+        ).delete()
+        for message_id in removals:
+            ids.pop(message_id, None)
+    if deltas:
+        # the version bump rides along with the counts
+        MessageReactionCount.objects.filter(
+            message_id__in={pk for by_message in deltas.values() for pk in by_message}
+        ).update(
+            version=F("version") + 1,
+            **{
+                field: F(field)
+                + Case(
+                    *(
+                        When(message_id=pk, then=Value(delta))
+                        for pk, delta in by_message.items()
+                    ),
+                    default=Value(0),
+                )
+                for field, by_message in deltas.items()
+            },
+        )
+    return previous, ids
@@ -0,0 +1,147 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, router, transaction
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from authentication.authentication import CachedJWTAuthentication
+from chats.models import ChatGroup, Message
+from chats.pubsub import get_broker, group_channel
+from chats.sharding import fan_out
+
+WEBSOCKET_PATH = "/ws/v1/chatgroups/"
+SUBSCRIBER_QUEUE_SIZE = 1000
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_TOO_SLOW = 4408
+
+
+def publish_group_event(group_id, event, using=None):
+    """Publish ``event`` to the group's subscribers once the current
+    transaction on ``using``, by default the group's database, commits."""
+    event = dict(event, group=group_id)
+    transaction.on_commit(
+        lambda: get_broker().publish(group_channel(group_id), event),
+        using=using or router.db_for_write(Message),
+    )
+
+
+def message_event(message, event_type="message.created"):
+    return {
+        "type": event_type,
+        "message": {
+            "id": message.pk,
+            "text": message.text,
+            "sender": message.sender.username,
+            "timestamp": message.timestamp.isoformat(),
+        },
+    }
+
+
+def status_event(message_id, username, status, event_type):
+    return {
+        "type": event_type,
+        "message": message_id,
+        "owner": username,
+        "status": status,
+    }
+
+
+def _get_raw_token(scope):
+    query = parse_qs(scope.get("query_string", b"").decode())
+    if query.get("token"):
+        return query["token"][0].encode()
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            parts = value.split()
+            if len(parts) == 2 and parts[0].lower() == b"bearer":
+                return parts[1]
+    return None
+
+
+@sync_to_async
+def authenticate(scope):
+    raw_token = _get_raw_token(scope)
+    if raw_token is None:
+        return None
+    close_old_connections()
+    authentication = CachedJWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+@sync_to_async
+def get_group_ids(user):
+    return set(
+        fan_out(ChatGroup.objects.filter(members=user).values_list("id", flat=True))
+    )
+
+
+async def websocket_application(scope, receive, send):
+    """Pushes events of every group the authenticated user belongs to.
+
+    The access token is read from the ``token`` query parameter or a bearer
+    ``Authorization`` header. Group membership is resolved once on connect,
+    a member removed later stops receiving events for that group.
+    """
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    if scope["path"].rstrip("/") != WEBSOCKET_PATH.rstrip("/"):
+        await send({"type": "websocket.close"})
+        return
+    user = await authenticate(scope)
+    if user is None:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+    group_ids = await get_group_ids(user)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    overflowed = asyncio.Event()
+
+    def offer(event):
+        try:
+            events.put_nowait(event)
+        except asyncio.QueueFull:
+            overflowed.set()
+
+    # brokers block while the subscription is set up, keep them off the loop
+    subscription = await sync_to_async(get_broker().subscribe, thread_sensitive=False)(
+        [group_channel(group_id) for group_id in group_ids],
+        lambda event: loop.call_soon_threadsafe(offer, event),
+    )
+    receiver = getter = None
+    try:
+        await send({"type": "websocket.accept"})
+        receiver = asyncio.ensure_future(receive())
+        getter = asyncio.ensure_future(events.get())
+        while True:
+            done, _ = await asyncio.wait(
+                {receiver, getter}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(receive())
+            if getter in done:
+                event = getter.result()
+                if event.get("type") == "members.removed" and user.pk in event.get(
+                    "users", ()
+                ):
+                    group_ids.discard(event["group"])
+                elif event["group"] in group_ids:
+                    await send({"type": "websocket.send", "text": json.dumps(event)})
+                if overflowed.is_set():
+                    await send({"type": "websocket.close", "code": CLOSE_TOO_SLOW})
+                    break
+                getter = asyncio.ensure_future(events.get())
+    finally:
+        for future in (receiver, getter):
+            if future is not None:
+                future.cancel()
+        await sync_to_async(subscription.close, thread_sensitive=False)()
@@ -0,0 +1,72 @@
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+# field order of the tuple rows served by message history endpoints
+MESSAGE_COLUMNS = ("id", "timestamp", "text", "sender")
+
+_fallback_encoder = JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def _default(obj):
+    """Types orjson and msgpack do not know natively, encoded the way DRF's
+    JSON encoder does."""
+    if hasattr(obj, "isoformat"):
+        representation = obj.isoformat()
+        if representation.endswith("+00:00"):
+            representation = representation[:-6] + "Z"
+        return representation
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data):
+    """Compact JSON bytes, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(
+            data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        )
+    return _fallback_encoder.encode(data).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` encoding with orjson, falls back to DRF's encoder
+    when orjson is missing or indented output was asked for."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(
+            accepted_media_type or "", renderer_context or {}
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def message_renderers():
+    """Renderers offered by the high volume read endpoints, MessagePack only
+    when the ``msgpack`` package is installed."""
+    renderers = [FastJSONRenderer]
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers + [BrowsableAPIRenderer]
@@ -0,0 +1,81 @@
+import re
+
+from django.db import connections, router
+
+from chats.models import Message
+
+# created by migration 0004, on sqlite the FTS5 table is kept in sync by
+# triggers on chats_message, which sqlite drops whenever a migration rebuilds
+# that table, so such migrations must create them again
+FTS_TABLE = "chats_message_fts"
+POSTGRES_VECTOR = "to_tsvector('simple', coalesce(text, ''))"
+
+
+def search_message_ids(group_id, query, limit, offset=0):
+    """Return ids of the group's hot messages matching ``query``, best match
+    first."""
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return []
+    connection = connections[router.db_for_read(Message)]
+    vendor = connection.vendor
+    if vendor == "sqlite":
+        # quoting every term keeps user input out of the FTS5 query syntax
+        match = " ".join(f'"{term}"' for term in terms)
+        sql = (
+            f"SELECT m.id FROM {FTS_TABLE} f "
+            f"JOIN chats_message m ON m.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND m.group_id = %s "
+            f"ORDER BY f.rank, m.id DESC LIMIT %s OFFSET %s"
+        )
+        params = [match, group_id, limit, offset]
+    elif vendor == "postgresql":
+        sql = (
+            f"SELECT id FROM chats_message "
+            f"WHERE group_id = %s AND {POSTGRES_VECTOR} @@ plainto_tsquery('simple', %s) "
+            f"ORDER BY ts_rank({POSTGRES_VECTOR}, plainto_tsquery('simple', %s)) DESC, "
+            f"id DESC LIMIT %s OFFSET %s"
+        )
+        params = [group_id, query, query, limit, offset]
+    elif vendor == "mysql":
+        match = " ".join(f"+{term}" for term in terms)
+        sql = (
+            "SELECT id FROM chats_message "
+            "WHERE group_id = %s AND MATCH(text) AGAINST (%s IN BOOLEAN MODE) "
+            "ORDER BY MATCH(text) AGAINST (%s IN BOOLEAN MODE) DESC, id DESC "
+            "LIMIT %s OFFSET %s"
+        )
+        params = [group_id, match, match, limit, offset]
+    else:
+        queryset = Message.objects.filter(group_id=group_id)
+        for term in terms:
+            queryset = queryset.filter(text__icontains=term)
+        return list(
+            queryset.order_by("-id").values_list("id", flat=True)[
+                offset : offset + limit
+            ]
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_messages(group_id, query, limit, offset=0):
+    """Matching messages of the group, best match first.
+
+    Only hot messages are indexed, archived ones are never returned.
+    """
+    ids = search_message_ids(group_id, query, limit, offset)
+    rows = {
+        row["id"]: row
+        for row in Message.objects.filter(id__in=ids).values(
+            "id", "text", "sender__username", "timestamp"
+        )
+    }
+    results = []
+    for pk in ids:
+        row = rows.get(pk)
+        if row is not None:
+            row["sender"] = row.pop("sender__username")
+            results.append(row)
+    return results
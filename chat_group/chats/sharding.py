@@ -0,0 +1,490 @@
+import heapq
+import threading
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from chat_group.caching import LocalTTLCache
+from chats.models import (
+    ChatGroup,
+    GroupPlacement,
+    Message,
+    MessageArchiveSegment,
+    MessageReactionCount,
+    MessageStatus,
+    ReadMarker,
+    ShardIdBlock,
+    UsernameVersion,
+)
+
+User = get_user_model()
+
+# 2 ** 13 blocks of 2 ** 40 ids stay below 2 ** 53, exact in JavaScript
+ID_BLOCK_BITS = 40
+COPY_CHUNK_SIZE = 1000
+DIRECTORY_MODELS = (GroupPlacement, ShardIdBlock, UsernameVersion)
+# tables whose sequences a shard reserves id blocks for, group ids come from
+# GroupPlacement
+SEQUENCE_MODELS = (Message, MessageStatus, ReadMarker, MessageArchiveSegment)
+
+_current_shard = ContextVar("chats_shard", default=None)
+
+
+class GroupMoveConflict(Exception):
+    pass
+
+
+def shard_aliases():
+    return settings.CHAT_SHARDING["SHARDS"]
+
+
+def sharding_enabled():
+    return bool(settings.CHAT_SHARDING["SHARDS"])
+
+
+def home_shard(group_id):
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(group_id).encode()) % len(aliases)]
+
+
+@contextmanager
+def use_shard(alias):
+    """Route queries of the chats models to ``alias`` inside the block,
+    ``None`` leaves them to the other routers."""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def bind_shard(iterable):
+    """Keep the current shard for an iterable consumed after the block that
+    selected it, such as a streaming response body."""
+    return _iter_on_shard(_current_shard.get(), iter(iterable))
+
+
+def _iter_on_shard(alias, iterator):
+    while True:
+        with use_shard(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class ShardDirectory:
+    """Resolves groups and messages to their shard.
+
+    Group placements are cached per process for ``ttl`` seconds, which bounds
+    how long other processes keep using the old shard of a moved group.
+    Messages never change group, so their group ids are cached as well;
+    on a miss the shard whose id block contains the id is probed first.
+    """
+
+    def __init__(self, max_entries=100000, ttl=60):
+        self.groups = LocalTTLCache(max_entries=max_entries, ttl=ttl)
+        self.messages = LocalTTLCache(max_entries=max_entries, ttl=24 * 60 * 60)
+        self._blocks = {}
+
+    def group_shard(self, group_id):
+        alias = self.groups.get(group_id)
+        if alias is None:
+            alias = (
+                GroupPlacement.objects.filter(pk=group_id)
+                .values_list("shard", flat=True)
+                .first()
+            )
+            if alias is None:
+                # unknown groups resolve to their home shard and 404 there
+                return home_shard(group_id)
+            self.groups.set(group_id, alias)
+        return alias
+
+    def block_shard(self, message_id):
+        block = message_id >> ID_BLOCK_BITS
+        if block not in self._blocks:
+            self._blocks = dict(ShardIdBlock.objects.values_list("id", "shard"))
+        return self._blocks.get(block)
+
+    def message_shard(self, message_id):
+        group_id = self.messages.get(message_id)
+        if group_id is None:
+            guess = self.block_shard(message_id)
+            aliases = shard_aliases()
+            for alias in sorted(aliases, key=lambda alias: alias != guess):
+                group_id = (
+                    Message.objects.using(alias)
+                    .filter(pk=message_id)
+                    .values_list("group_id", flat=True)
+                    .first()
+                )
+                if group_id is not None:
+                    break
+            else:
+                return guess or aliases[0]
+            self.messages.set(message_id, group_id)
+        return self.group_shard(group_id)
+
+    def invalidate(self, group_id):
+        self.groups.delete(group_id)
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory():
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                config = settings.CHAT_SHARDING
+                _directory = ShardDirectory(
+                    max_entries=config.get("MAX_ENTRIES", 100000),
+                    ttl=config.get("TTL", 60),
+                )
+    return _directory
+
+
+@receiver(setting_changed)
+def reset_directory(*, setting, **kwargs):
+    global _directory
+    if setting == "CHAT_SHARDING":
+        _directory = None
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_for_group(group_id):
+    """Alias of the group's shard, ``None`` when sharding is disabled or the
+    id is not a number."""
+    group_id = _as_id(group_id)
+    if not sharding_enabled() or group_id is None:
+        return None
+    return get_directory().group_shard(group_id)
+
+
+def shard_for_message(message_id):
+    message_id = _as_id(message_id)
+    if not sharding_enabled() or message_id is None:
+        return None
+    return get_directory().message_shard(message_id)
+
+
+def partition(items, shard_of):
+    """Group ``items`` by ``shard_of(item)``, one ``None`` group when sharding
+    is disabled."""
+    if not sharding_enabled():
+        return {None: list(items)}
+    parts = {}
+    for item in items:
+        parts.setdefault(shard_of(item), []).append(item)
+    return parts
+
+
+def fan_out(queryset, key=None):
+    """Run ``queryset`` on every shard and merge the results, each shard's
+    rows must already be ordered by ``key``. Without sharding the queryset
+    is returned as is."""
+    if not sharding_enabled():
+        return queryset
+    return list(
+        heapq.merge(*(queryset.using(alias) for alias in shard_aliases()), key=key)
+    )
+
+
+def create_group(**fields):
+    """Create a group on its home shard under a newly allocated id."""
+    if not sharding_enabled():
+        return ChatGroup.objects.create(**fields)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        placement = GroupPlacement.objects.create()
+        placement.shard = home_shard(placement.pk)
+        placement.save(update_fields=["shard"])
+    return ChatGroup.objects.using(placement.shard).create(pk=placement.pk, **fields)
+
+
+def _bump_sequences(alias, start):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in SEQUENCE_MODELS:
+            table = model._meta.db_table
+            if connection.vendor == "sqlite":
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s",
+                    [start, table, start],
+                )
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)",
+                    [table, start],
+                )
+            elif connection.vendor == "mysql":
+                cursor.execute(
+                    f"ALTER TABLE {connection.ops.quote_name(table)} "
+                    f"AUTO_INCREMENT = {int(start)}"
+                )
+
+
+def reserve_id_block(alias):
+    """Point the shard's sequences at a new block above every id handed out
+    so far, keeping ids unique over all shards and increasing per group
+    even after it moved."""
+    block = ShardIdBlock.objects.create(shard=alias)
+    get_directory()._blocks[block.pk] = alias
+    _bump_sequences(alias, block.pk << ID_BLOCK_BITS)
+    return block.pk
+
+
+def _insert_rows(model, attnames, rows, alias):
+    connection = connections[alias]
+    fields = [model._meta.get_field(attname) for attname in attnames]
+    quote = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        quote(model._meta.db_table),
+        ", ".join(quote(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            sql,
+            [
+                [
+                    field.get_db_prep_save(value, connection)
+                    for field, value in zip(fields, row)
+                ]
+                for row in rows
+            ],
+        )
+
+
+def copy_rows(queryset, alias, chunk_size=COPY_CHUNK_SIZE, keep_pk=True):
+    """Insert the rows of ``queryset`` into ``alias`` as they are, ``auto_now``
+    timestamps and, unless ``keep_pk`` is false, ids included. Returns the
+    number of rows."""
+    model = queryset.model
+    attnames = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if keep_pk or not field.primary_key
+    ]
+    copied = 0
+    chunk = []
+    for row in queryset.order_by("pk").values_list(*attnames).iterator(chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            _insert_rows(model, attnames, chunk, alias)
+            copied += len(chunk)
+            chunk = []
+    if chunk:
+        _insert_rows(model, attnames, chunk, alias)
+        copied += len(chunk)
+    return copied
+
+
+def replicate_users(user_ids=None, aliases=None):
+    """Copy user rows, without passwords, from the default database to the
+    shards, where the chats tables join and reference them."""
+    attnames = [field.attname for field in User._meta.concrete_fields]
+    pk_index = attnames.index(User._meta.pk.attname)
+    password_index = attnames.index("password")
+    users = User._base_manager.using(DEFAULT_DB_ALIAS)
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    rows = []
+    for row in users.values_list(*attnames):
+        row = list(row)
+        row[password_index] = "!"
+        rows.append(row)
+    for alias in aliases or shard_aliases():
+        if alias == DEFAULT_DB_ALIAS or not rows:
+            continue
+        replicas = User._base_manager.using(alias)
+        existing = set(
+            replicas.filter(pk__in=[row[pk_index] for row in rows]).values_list(
+                "pk", flat=True
+            )
+        )
+        _insert_rows(
+            User,
+            attnames,
+            [row for row in rows if row[pk_index] not in existing],
+            alias,
+        )
+        for row in rows:
+            if row[pk_index] in existing:
+                replicas.filter(pk=row[pk_index]).update(
+                    **{
+                        attname: value
+                        for attname, value in zip(attnames, row)
+                        if attname != User._meta.pk.attname
+                    }
+                )
+
+
+def move_group(group_id, target):
+    """Move a group with its memberships, messages, reactions, read markers
+    and archive segments to the ``target`` shard.
+
+    The group's rows on the source stay locked while they are copied in one
+    transaction on the target, the placement is switched and the source rows
+    are deleted, so writes to the group wait for the move and then fail
+    instead of getting lost. Processes pick up the new placement within the
+    directory TTL. Raises ``GroupMoveConflict``, with nothing moved, if the
+    rows changed during the copy anyway.
+    """
+    source = get_directory().group_shard(group_id)
+    if source == target:
+        return {}
+    groups = ChatGroup.objects.using(source).filter(pk=group_id)
+    if not groups.exists():
+        raise ChatGroup.DoesNotExist(f"Chat group {group_id} does not exist.")
+    messages = Message.objects.using(source).filter(group_id=group_id)
+    memberships = ChatGroup.members.through.objects.using(source).filter(
+        chatgroup_id=group_id
+    )
+    querysets = {
+        "groups": groups,
+        "members": memberships,
+        "messages": messages,
+        "statuses": MessageStatus.objects.using(source).filter(
+            message__group_id=group_id
+        ),
+        "reaction_counts": MessageReactionCount.objects.using(source).filter(
+            message__group_id=group_id
+        ),
+        "read_markers": ReadMarker.objects.using(source).filter(group_id=group_id),
+        "archive_segments": MessageArchiveSegment.objects.using(source).filter(
+            group_id=group_id
+        ),
+    }
+    user_ids = set(memberships.values_list("user_id", flat=True))
+    user_ids.update(messages.values_list("sender_id", flat=True).distinct())
+    user_ids.update(querysets["statuses"].values_list("owner_id", flat=True).distinct())
+    user_ids.update(groups.exclude(owner=None).values_list("owner_id", flat=True))
+    replicate_users(user_ids, aliases=[target])
+    with transaction.atomic(using=source):
+        _lock_rows(source, querysets)
+        with transaction.atomic(using=target):
+            # membership ids come from no id block, the target assigns new ones
+            copied = {
+                name: copy_rows(queryset, target, keep_pk=name != "members")
+                for name, queryset in querysets.items()
+            }
+            changed = [
+                name
+                for name, queryset in querysets.items()
+                if queryset.count() != copied[name]
+            ]
+            if changed:
+                raise GroupMoveConflict(
+                    f"Chat group {group_id} changed while moving: {', '.join(changed)}."
+                )
+        reserve_id_block(target)
+        GroupPlacement.objects.update_or_create(pk=group_id, defaults={"shard": target})
+        get_directory().invalidate(group_id)
+        groups.delete()
+    return copied
+
+
+def _lock_rows(alias, querysets):
+    """Block writes to the rows of ``querysets`` on ``alias``, and inserts
+    referencing them, until the current transaction ends."""
+    if connections[alias].vendor == "sqlite":
+        # no row locks, any write takes the database wide write lock
+        querysets["groups"].update(name=F("name"))
+        return
+    for queryset in querysets.values():
+        for _ in (
+            queryset.select_for_update()
+            .values_list("pk", flat=True)
+            .iterator(COPY_CHUNK_SIZE)
+        ):
+            pass
+
+
+class ShardRouter:
+    """Sends the chats models to the shard selected with ``use_shard``, or
+    to the database of the chats object they are reached from, which also
+    covers the users replicated to every shard. The placement directory
+    stays on the default database. Does nothing unless ``CHAT_SHARDING``
+    lists shards.
+    """
+
+    def _db(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        if model in DIRECTORY_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if (
+            instance is not None
+            and instance._meta.app_label == "chats"
+            and instance._state.db is not None
+        ):
+            return instance._state.db
+        if model._meta.app_label == "chats":
+            return _current_shard.get()
+        return None
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding_enabled():
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == "chats" and model_name in (
+            model._meta.model_name for model in DIRECTORY_MODELS
+        ):
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+@receiver(post_migrate)
+def prepare_shard(sender, using, **kwargs):
+    if sender.name != "chats" or using not in shard_aliases():
+        return
+    if not ShardIdBlock.objects.filter(shard=using).exists():
+        reserve_id_block(using)
+    replicate_users(aliases=[using])
+
+
+@receiver(post_save, sender=User)
+def replicate_saved_user(sender, instance, created, update_fields, using, **kwargs):
+    if not sharding_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    if not created and update_fields and "username" not in update_fields:
+        return
+    transaction.on_commit(lambda: replicate_users([instance.pk]), using=using)
+
+
+@receiver(post_delete, sender=User)
+def delete_replicated_user(sender, instance, using, **kwargs):
+    if not sharding_enabled() or using != DEFAULT_DB_ALIAS:
+        return
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            User._base_manager.using(alias).filter(pk=instance.pk).delete()
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, pre_save
+from django.dispatch import receiver
+
+from chats.conditional import get_usernames_version
+from chats.membership import get_membership_cache
+from chats.models import ChatGroup
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=ChatGroup.members.through)
+def invalidate_membership_on_change(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    if action not in ("post_add", "post_remove", "pre_clear", "post_clear"):
+        return
+    if not reverse:
+        group_ids = [instance.pk]
+    elif action == "pre_clear":
+        # the cleared groups are only known before the rows are gone
+        group_ids = list(instance.chatgroup_set.values_list("id", flat=True))
+    else:
+        group_ids = list(pk_set or ())
+    if group_ids:
+        get_membership_cache().invalidate_on_commit(*group_ids, using=using)
+
+
+@receiver(post_delete, sender=ChatGroup)
+def invalidate_membership_on_delete(sender, instance, using, **kwargs):
+    get_membership_cache().invalidate_on_commit(instance.pk, using=using)
+
+
+@receiver(pre_save, sender=User)
+def count_rename(sender, instance, raw, using, update_fields, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and "username" not in update_fields:
+        return
+    previous = (
+        sender._base_manager.using(using)
+        .filter(pk=instance.pk)
+        .values_list("username", flat=True)
+        .first()
+    )
+    if previous is not None and previous != instance.username:
+        get_usernames_version().bump()
@@ -1,15 +1,67 @@
-from chats.models import ChatGroup, Message
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from chats.models import ChatGroup, Message, MessageArchiveSegment, MessageStatus
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
 from model_mommy import mommy
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from chats.chat_client import ChatTestApiClient
+from authentication.authentication import get_user_cache
+from chat_group.metrics import registry
+from chat_group.routers import _current_request, get_write_pins, request_user_id
+from chat_group.throttling import LocalRedisBuckets, RedisBucketStore, get_throttling
+from chats import benchmark
+from chats.chat_client import ChatTestApiClient, logged_in_client, make_user
+from chats.conditional import get_usernames_version
+from chats.longpoll import long_poll_application, messages_after
+from chats.idempotency import IdempotencyStore, get_idempotency_store
+from chats.membership import MembershipCache, get_membership_cache
+from chats.pubsub import InProcessBroker, LocalRedis, RedisBroker
+from chats.realtime import websocket_application
+from chats.renderers import msgpack
+from chats.sharding import (
+    ID_BLOCK_BITS,
+    GroupMoveConflict,
+    copy_rows,
+    home_shard,
+    move_group,
+    shard_for_group,
+)
+from chats.writebehind import MessageWriteBuffer, QueueFull, get_write_buffer
 
 User = get_user_model()
 
 
-class E2ETestCase(APITestCase):
+class ChatAPITestCase(APITestCase):
     def setUp(self):
+        # process wide caches outlive the per-test transaction rollback
+        get_membership_cache().local.clear()
+        get_user_cache().clear()
+        get_idempotency_store().local.clear()
+        get_throttling().store.clear()
+        get_usernames_version().local.clear()
+        cache.clear()
+
+
+class E2ETestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
         self.superuser = mommy.make(User, username="dev", is_superuser=True)
         self.superuser.set_password("dev")
         self.superuser.save()
@@ -55,9 +107,11 @@ class E2ETestCase(APITestCase):
         # Test 6: Get Users for all users
         all_user_counts = User.objects.count()
         all_users_for_superuser = superuser_client.get_user()
-        self.assertEqual(len(all_users_for_superuser.json()), all_user_counts)
+        self.assertEqual(len(all_users_for_superuser.json()["users"]), all_user_counts)
         all_users_for_nonsuperuser = non_superuser_client.get_user()
-        self.assertEqual(len(all_users_for_nonsuperuser.json()), all_user_counts)
+        self.assertEqual(
+            len(all_users_for_nonsuperuser.json()["users"]), all_user_counts
+        )
 
         # Test 6: Create/update groups for all users
         all_groups = ChatGroup.objects.count()
@@ -168,3 +222,1362 @@ class E2ETestCase(APITestCase):
                 ]
             },
         )
+
+        # Test 10: Reaction counters follow every status change
+        non_superuser_client.update_like_message(message_obj.pk, "heart")
+        non_superuser_client2.unlike_message(message_obj.pk)
+        superuser_client.like_message(message_obj.pk, "dislike")
+        summary = superuser_client.get_reaction_summary(message_obj.pk)
+        self.assertEqual(summary.status_code, 200)
+        self.assertEqual(
+            summary.json(), {"summary": {"like": 0, "dislike": 1, "heart": 1}}
+        )
+
+
+class MessagePaginationTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, name="Paged", owner=self.user)
+        self.group.members.add(self.user)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(7)
+        )
+        self.client = logged_in_client("dev")
+
+    def test_walk_history_with_cursors(self):
+        latest = self.client.get_messages(self.group.pk, limit=3).json()
+        self.assertEqual(
+            [m["text"] for m in latest["messages"]],
+            ["message 4", "message 5", "message 6"],
+        )
+        self.assertTrue(latest["has_more"])
+
+        older = self.client.get_messages(
+            self.group.pk, limit=3, before=latest["older"]
+        ).json()
+        self.assertEqual(
+            [m["text"] for m in older["messages"]],
+            ["message 1", "message 2", "message 3"],
+        )
+        oldest = self.client.get_messages(
+            self.group.pk, limit=3, before=older["older"]
+        ).json()
+        self.assertEqual([m["text"] for m in oldest["messages"]], ["message 0"])
+        self.assertFalse(oldest["has_more"])
+        self.assertIsNone(oldest["older"])
+
+        newer = self.client.get_messages(
+            self.group.pk, limit=3, after=older["newer"]
+        ).json()
+        self.assertEqual(newer["messages"], latest["messages"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get_messages(self.group.pk, before="not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+    def test_columnar_layout(self):
+        rows = self.client.get_messages(self.group.pk, limit=3).json()["messages"]
+        page = self.client.get_messages(self.group.pk, limit=3, layout="columns").json()
+        self.assertEqual(page["columns"], ["id", "timestamp", "text", "sender"])
+        self.assertEqual(
+            [dict(zip(page["columns"], row)) for row in page["rows"]], rows
+        )
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack_negotiation(self):
+        response = self.client.client.get(
+            f"/api/v1/chatgroups/{self.group.pk}/messages/",
+            HTTP_ACCEPT="application/x-msgpack",
+        )
+        self.assertEqual(response["Content-Type"], "application/x-msgpack")
+        self.assertEqual(len(msgpack.unpackb(response.content)["messages"]), 7)
+
+
+class PubSubTestCase(SimpleTestCase):
+    def test_in_process_broker(self):
+        broker = InProcessBroker()
+        received = []
+        subscription = broker.subscribe(["chatgroup.1"], received.append)
+        broker.publish("chatgroup.1", {"type": "message.created"})
+        broker.publish("chatgroup.2", {"type": "message.created"})
+        subscription.close()
+        broker.publish("chatgroup.1", {"type": "message.created"})
+        self.assertEqual(received, [{"type": "message.created"}])
+
+    def test_redis_broker_fans_out_across_nodes(self):
+        server = LocalRedis()
+        node1, node2 = RedisBroker(client=server), RedisBroker(client=server)
+        received = []
+        node2.subscribe(["chatgroup.1"], received.append)
+        node1.publish("chatgroup.1", {"type": "message.created", "group": 1})
+        deadline = time.monotonic() + 5
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        node1.close()
+        node2.close()
+        self.assertEqual(received, [{"type": "message.created", "group": 1}])
+
+    def test_redis_broker_does_not_wait_on_polls(self):
+        broker = RedisBroker(client=LocalRedis())
+        first = broker.subscribe(["chatgroup.1"], lambda event: None)
+        started = time.monotonic()
+        # channels already live and unsubscribes skip the listener's poll
+        second = broker.subscribe(["chatgroup.1"], lambda event: None)
+        second.close()
+        first.close()
+        elapsed = time.monotonic() - started
+        broker.close()
+        self.assertLess(elapsed, broker.poll_timeout / 2)
+
+    def test_redis_broker_backs_off_and_resubscribes(self):
+        server = LocalRedis()
+        broker = RedisBroker(client=server)
+        broker.reconnect_delay = 0.05
+        received = []
+        broker.subscribe(["chatgroup.1"], received.append)
+        pubsub = broker._pubsub
+        get_message = pubsub.get_message
+        failures = []
+
+        def flaky(timeout=0.0):
+            if len(failures) < 3:
+                failures.append(time.monotonic())
+                # a dropped connection loses its subscriptions
+                pubsub.channels.clear()
+                raise ConnectionError("Connection reset by peer")
+            return get_message(timeout=timeout)
+
+        with self.assertLogs("chats.pubsub", "ERROR"):
+            pubsub.get_message = flaky
+            deadline = time.monotonic() + 5
+            while "chatgroup.1" not in pubsub.channels or len(failures) < 3:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        RedisBroker(client=server).publish("chatgroup.1", {"type": "message.created"})
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        broker.close()
+        self.assertEqual(received, [{"type": "message.created"}])
+        # 0.05s then 0.1s between the attempts
+        self.assertGreaterEqual(failures[2] - failures[0], 0.15)
+
+
+class WebSocketTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, name="Live", owner=self.user)
+        self.group.members.add(self.user)
+
+    def post_message(self):
+        client = logged_in_client("dev")
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post_message("Hello!", self.group.pk)
+
+    def connect(self, query_string):
+        sent = []
+
+        async def run():
+            pushed = asyncio.Event()
+            connected = False
+
+            async def receive():
+                nonlocal connected
+                if not connected:
+                    connected = True
+                    return {"type": "websocket.connect"}
+                await asyncio.wait_for(pushed.wait(), timeout=5)
+                return {"type": "websocket.disconnect"}
+
+            async def send(event):
+                sent.append(event)
+                if event["type"] == "websocket.accept":
+                    await sync_to_async(self.post_message)()
+                if event["type"] == "websocket.send":
+                    pushed.set()
+
+            scope = {
+                "type": "websocket",
+                "path": "/ws/v1/chatgroups/",
+                "query_string": query_string,
+                "headers": [],
+            }
+            await websocket_application(scope, receive, send)
+
+        async_to_sync(run)()
+        return sent
+
+    def test_member_receives_new_messages(self):
+        token = AccessToken.for_user(self.user)
+        sent = self.connect(f"token={token}".encode())
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        event = json.loads(sent[1]["text"])
+        self.assertEqual(event["type"], "message.created")
+        self.assertEqual(event["group"], self.group.pk)
+        self.assertEqual(event["message"]["text"], "Hello!")
+
+    def test_rejects_missing_token(self):
+        sent = self.connect(b"")
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4401}])
+
+
+class LongPollTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        self.client = logged_in_client("dev")
+
+    def post_message(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post_message(text, self.group.pk)
+
+    def poll(self, query_string, during_wait=None):
+        sent = []
+
+        async def run():
+            async def receive():
+                await asyncio.Future()
+
+            async def send(event):
+                sent.append(event)
+
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": f"/api/v1/chatgroups/{self.group.pk}/messages/",
+                "query_string": query_string.encode(),
+                "headers": [(b"authorization", f"Bearer {token}".encode())],
+            }
+            poll = asyncio.ensure_future(long_poll_application(scope, receive, send))
+            if during_wait is not None:
+                await asyncio.sleep(0.2)
+                await sync_to_async(during_wait)()
+            await asyncio.wait_for(poll, timeout=5)
+
+        token = AccessToken.for_user(self.user)
+        async_to_sync(run)()
+        self.headers = dict(sent[0]["headers"])
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    def test_after_id_returns_newer_messages(self):
+        self.post_message("first")
+        first_id = Message.objects.get().pk
+        self.post_message("second")
+        page = self.client.poll_messages(self.group.pk, first_id).json()
+        self.assertEqual([m["text"] for m in page["messages"]], ["second"])
+        self.assertEqual(page["last_id"], first_id + 1)
+
+    def test_long_poll_wakes_on_new_message(self):
+        status, page = self.poll(
+            "after_id=0&wait=5", during_wait=lambda: self.post_message("hi")
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual([m["text"] for m in page["messages"]], ["hi"])
+
+    def test_long_poll_times_out_empty(self):
+        started = time.monotonic()
+        status, page = self.poll("after_id=0&wait=1")
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual((status, page["messages"]), (200, []))
+
+    def test_long_poll_validates_limit_like_history(self):
+        for limit in ("x", "0"):
+            status, body = self.poll(f"after_id=0&wait=1&limit={limit}")
+            self.assertEqual(status, 400)
+            self.assertEqual(
+                body, self.client.get_messages(self.group.pk, limit=limit).json()
+            )
+
+    def test_long_poll_reads_are_routed_as_requests(self):
+        requests = []
+
+        def record(*args):
+            requests.append(_current_request.get())
+            return messages_after(*args)
+
+        with mock.patch("chats.longpoll.messages_after", record):
+            self.assertEqual(self.poll("after_id=0&wait=0")[0], 200)
+        (request,) = requests
+        self.assertEqual(request.method, "GET")
+        self.assertEqual(request_user_id(request), self.user.pk)
+
+    def test_long_poll_is_throttled_and_measured(self):
+        registry.reset()
+        rates = {**settings.CHAT_THROTTLE["RATES"], "longpoll": {"user": "1/min"}}
+        with override_settings(
+            CHAT_THROTTLE={**settings.CHAT_THROTTLE, "RATES": rates}
+        ):
+            self.assertEqual(self.poll("after_id=0&wait=0")[0], 200)
+            self.assertEqual(self.poll("after_id=0&wait=0")[0], 429)
+        self.assertEqual(self.headers[b"retry-after"], b"60")
+        metrics = registry.render()
+        for status in ("2xx", "4xx"):
+            self.assertIn(
+                'http_requests_total{route="chatgroups-messages",method="GET",'
+                f'status="{status}"}} 1',
+                metrics,
+            )
+
+
+class BulkMembershipTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user("dev")
+        self.group = mommy.make(ChatGroup, name="Company", owner=self.owner)
+        self.group.members.add(self.owner)
+        User.objects.bulk_create(User(username=f"user{i}") for i in range(200))
+        self.usernames = [f"user{i}" for i in range(200)]
+        self.client = logged_in_client("dev")
+
+    def test_add_and_remove_in_bounded_queries(self):
+        self.client.get_chat_groups()  # warm the authenticated user cache
+        with self.assertNumQueries(4):
+            # group, validation and existing-membership lookups, then one
+            # bulk insert
+            response = self.client.add_members(self.group.pk, self.usernames)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.group.members.count(), 201)
+
+        response = self.client.remove_members(self.group.pk, self.usernames[:150])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.group.members.count(), 51)
+
+    def test_reports_all_missing_members(self):
+        response = self.client.add_members(self.group.pk, ["user1", "ghost2", "ghost1"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"members": ["Members: ghost1, ghost2 do not exist."]}
+        )
+        self.assertEqual(self.group.members.count(), 1)
+
+
+class MembershipCacheTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = mommy.make(User, username="dev")
+        self.group = mommy.make(ChatGroup, name="Cached", owner=self.user)
+        self.cache = MembershipCache(shared_cache="default")
+
+    def test_cached_until_membership_changes(self):
+        self.assertFalse(self.cache.is_member(self.group.pk, self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.cache.is_member(self.group.pk, self.user.pk))
+        self.assertEqual(self.cache.stats()["local_hits"], 1)
+
+        self.group.members.add(self.user)
+        self.assertTrue(get_membership_cache().is_member(self.group.pk, self.user.pk))
+        self.user.chatgroup_set.clear()
+        self.assertFalse(get_membership_cache().is_member(self.group.pk, self.user.pk))
+
+    def test_shared_tier(self):
+        self.group.members.add(self.user)
+        self.assertTrue(self.cache.is_member(self.group.pk, self.user.pk))
+        other_process = MembershipCache(shared_cache="default")
+        with self.assertNumQueries(0):
+            self.assertTrue(other_process.is_member(self.group.pk, self.user.pk))
+        self.assertEqual(other_process.stats()["shared_hits"], 1)
+
+    def test_invalidation_reaches_other_processes(self):
+        broker = InProcessBroker()
+        this_process = MembershipCache(broker=broker)
+        other_process = MembershipCache(broker=broker)
+        self.group.members.add(self.user)
+        self.assertTrue(other_process.is_member(self.group.pk, self.user.pk))
+        self.group.members.remove(self.user)
+        this_process.invalidate(self.group.pk)
+        self.assertFalse(other_process.is_member(self.group.pk, self.user.pk))
+
+
+class BulkMessageIngestTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.groups = mommy.make(ChatGroup, _quantity=3)
+        for group in self.groups[:2]:
+            group.members.add(self.user)
+        self.client = logged_in_client("dev")
+
+    def test_bulk_insert_with_per_item_results(self):
+        messages = [
+            {"text": f"backlog {i}", "group": self.groups[i % 2].pk}
+            for i in range(2500)
+        ]
+        messages.append({"text": "not a member", "group": self.groups[2].pk})
+        messages.append({"group": self.groups[0].pk})
+        # group ids are coerced by the item serializer
+        messages.append({"text": "as a string", "group": str(self.groups[0].pk)})
+        with mock.patch("chats.api.views.publish_group_event") as publish:
+            response = self.client.post_messages_bulk(messages)
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 2503)
+        self.assertEqual(sum(result["status"] == "created" for result in results), 2501)
+        self.assertEqual(results[2500]["status"], "rejected")
+        self.assertIn("text", results[2501]["errors"])
+        self.assertEqual(Message.objects.count(), 2501)
+        self.assertEqual(Message.objects.filter(group=self.groups[0]).count(), 1251)
+        created = [result for result in results if result["status"] == "created"]
+        self.assertEqual(Message.objects.get(pk=created[-1]["id"]).text, "as a string")
+        self.assertEqual(len({result["id"] for result in created}), 2501)
+        self.assertEqual(
+            sorted(call.args[:2] for call in publish.call_args_list),
+            sorted(
+                [
+                    (self.groups[0].pk, {"type": "messages.imported", "count": 1251}),
+                    (self.groups[1].pk, {"type": "messages.imported", "count": 1250}),
+                ]
+            ),
+        )
+
+
+class IdempotentMessageTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        self.client = logged_in_client("dev")
+
+    def test_retry_is_replayed(self):
+        response = self.client.post_message("hi", self.group.pk, idempotency_key="k1")
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.client.post_message("hi", self.group.pk, idempotency_key="k1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Message.objects.count(), 1)
+
+        reused = self.client.post_message("bye", self.group.pk, idempotency_key="k1")
+        self.assertEqual(reused.status_code, 422)
+        self.client.post_message("hi", self.group.pk, idempotency_key="k2")
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_client_message_id_must_be_a_string(self):
+        response = self.client.client.post(
+            "/api/v1/messages/",
+            data={"text": "hi", "group": self.group.pk, "client_message_id": 5},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_request_releases_key(self):
+        other = mommy.make(ChatGroup)
+        response = self.client.post_message("hi", other.pk, idempotency_key="k")
+        self.assertEqual(response.status_code, 401)
+        other.members.add(self.user)
+        response = self.client.post_message("hi", other.pk, idempotency_key="k")
+        self.assertEqual(response.status_code, 201)
+
+    def test_shared_claim_across_processes(self):
+        first = IdempotencyStore(shared_cache="default")
+        second = IdempotencyStore(shared_cache="default")
+        self.assertIsNone(first.begin(1, "k", "f"))
+        self.assertEqual(second.begin(1, "k", "f")["state"], "pending")
+        first.complete(1, "k", "f", 201, "Message Created")
+        self.assertEqual(second.begin(1, "k", "f")["data"], "Message Created")
+
+
+class WriteBehindTestCase(APITransactionTestCase):
+    # the writer thread commits on its own connection
+    def setUp(self):
+        get_membership_cache().local.clear()
+        get_user_cache().clear()
+        get_idempotency_store().local.clear()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+
+    def test_queued_messages_are_written_in_batches(self):
+        config = dict(settings.CHAT_WRITE_BEHIND, ENABLED=True, FLUSH_INTERVAL_MS=200)
+        with self.settings(CHAT_WRITE_BEHIND=config):
+            client = logged_in_client("dev")
+            responses = [client.post_message(f"m{i}", self.group.pk) for i in range(5)]
+            self.assertEqual({r.status_code for r in responses}, {202})
+            self.assertEqual(len({r.data["provisional_id"] for r in responses}), 5)
+            get_write_buffer().stop()
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("text", flat=True)),
+            [f"m{i}" for i in range(5)],
+        )
+
+    def test_backpressure_and_drain(self):
+        buffer = MessageWriteBuffer(max_queue=2, enqueue_timeout=0)
+        buffer.submit(self.user, self.group.pk, "a")
+        buffer.submit(self.user, self.group.pk, "b")
+        with self.assertRaises(QueueFull):
+            buffer.submit(self.user, self.group.pk, "c")
+        buffer.start()
+        buffer.stop()
+        self.assertEqual(buffer.written, 2)
+        self.assertEqual(Message.objects.count(), 2)
+        with self.assertRaises(QueueFull):
+            buffer.submit(self.user, self.group.pk, "d")
+
+    def test_failing_rows_are_dead_lettered(self):
+        buffer = MessageWriteBuffer(retry_delay=0)
+        buffer.submit(self.user, self.group.pk, "a")
+        # no such group, the foreign key fails the whole batch
+        buffer.submit(self.user, self.group.pk + 1000, "lost")
+        buffer.submit(self.user, self.group.pk, "b")
+        buffer.start()
+        buffer.stop()
+        self.assertEqual((buffer.written, buffer.failed), (2, 1))
+        self.assertEqual([item[4] for item in buffer.dead_letters], ["lost"])
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("text", flat=True)),
+            ["a", "b"],
+        )
+
+
+class ReplicaRoutingTestCase(APITransactionTestCase):
+    def setUp(self):
+        get_membership_cache().local.clear()
+        get_user_cache().clear()
+        self.directory = tempfile.TemporaryDirectory()
+        connections.databases["replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(self.directory.name, "replica.sqlite3"),
+        }
+        call_command("migrate", database="replica", verbosity=0)
+        # the replica starts as a copy of the primary and then lags behind
+        self.user = User.objects.create_user(username="dev", password="dev")
+        self.group = ChatGroup.objects.create(name="Replicated", owner=self.user)
+        self.group.members.add(self.user)
+        self.user.save(using="replica", force_insert=True)
+        self.group.save(using="replica", force_insert=True)
+        ChatGroup.members.through.objects.using("replica").create(
+            chatgroup_id=self.group.pk, user_id=self.user.pk
+        )
+
+    def tearDown(self):
+        connections["replica"].close()
+        del connections.databases["replica"]
+        self.directory.cleanup()
+
+    def test_reads_stick_to_primary_after_write(self):
+        with self.settings(DATABASE_REPLICAS=["replica"]):
+            client = logged_in_client("dev")
+            self.assertEqual(client.post_message("hi", self.group.pk).status_code, 201)
+            messages = client.get_messages(self.group.pk).json()["messages"]
+            self.assertEqual([m["text"] for m in messages], ["hi"])
+
+            get_write_pins().local.clear()
+            self.assertEqual(client.get_messages(self.group.pk).json()["messages"], [])
+        self.assertEqual(Message.objects.using("replica").count(), 0)
+
+
+class ShardingTestCase(APITransactionTestCase):
+    def setUp(self):
+        get_membership_cache().local.clear()
+        get_user_cache().clear()
+        get_throttling().store.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.shards = ["shard1", "shard2"]
+        for alias in self.shards:
+            connections.databases[alias] = {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(self.directory.name, f"{alias}.sqlite3"),
+            }
+        self.sharding = self.settings(
+            CHAT_SHARDING=dict(settings.CHAT_SHARDING, SHARDS=self.shards)
+        )
+        self.sharding.enable()
+        for alias in self.shards:
+            call_command("migrate", database=alias, verbosity=0)
+        User.objects.create_user(username="dev", password="dev")
+        self.client = logged_in_client("dev")
+
+    def tearDown(self):
+        self.sharding.disable()
+        for alias in self.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        self.directory.cleanup()
+
+    def create_groups(self, count):
+        return [
+            self.client.create_chat_group(f"group {i}").json()["id"]
+            for i in range(count)
+        ]
+
+    def test_groups_are_placed_by_id_and_listed_in_order(self):
+        group_ids = self.create_groups(4)
+        placements = {group_id: home_shard(group_id) for group_id in group_ids}
+        self.assertEqual(set(placements.values()), set(self.shards))
+        for group_id, alias in placements.items():
+            self.assertTrue(ChatGroup.objects.using(alias).filter(pk=group_id).exists())
+            self.assertEqual(self.client.post_message("hi", group_id).status_code, 201)
+        self.assertFalse(ChatGroup.objects.exists())
+        self.assertFalse(Message.objects.exists())
+
+        groups = self.client.get_chat_groups().json()
+        self.assertEqual([group["id"] for group in groups], group_ids)
+        self.assertEqual([group["member_count"] for group in groups], [1] * 4)
+        unread = self.client.get_unread().json()["groups"]
+        # the only messages are the caller's own
+        self.assertEqual(
+            [(g["group"], g["unread"]) for g in unread], [(g, 0) for g in group_ids]
+        )
+
+        # message ids come from per shard blocks and route back to their shard
+        ids = {
+            alias: list(Message.objects.using(alias).values_list("id", flat=True))
+            for alias in self.shards
+        }
+        self.assertEqual(len(set(ids["shard1"]) | set(ids["shard2"])), 4)
+        for alias, message_ids in ids.items():
+            self.assertEqual(len({pk >> ID_BLOCK_BITS for pk in message_ids}), 1)
+            self.assertEqual(self.client.like_message(message_ids[0]).status_code, 201)
+            self.assertEqual(MessageStatus.objects.using(alias).count(), 1)
+
+    def test_benchmark_seeds_through_placement(self):
+        options = dict(users=4, groups=4, members_per_group=3, messages=20, reactions=5)
+        dataset = benchmark.seed(**options)
+        self.assertEqual(benchmark.seed(**options), dataset)
+        self.assertFalse(ChatGroup.objects.exists())
+        messages = 0
+        for group_id in dataset["memberships"]:
+            alias = shard_for_group(group_id)
+            self.assertTrue(ChatGroup.objects.using(alias).filter(pk=group_id).exists())
+            messages += Message.objects.using(alias).filter(group_id=group_id).count()
+        self.assertEqual(messages, 20)
+        report = benchmark.run(dataset, concurrency=1, iterations=10)
+        for endpoint in report["endpoints"].values():
+            self.assertEqual(endpoint["errors"], 0)
+
+    def test_move_group(self):
+        (group_id,) = self.create_groups(1)
+        for text in ("one", "two"):
+            self.client.post_message(text, group_id)
+        source = shard_for_group(group_id)
+        (target,) = set(self.shards) - {source}
+        first_id = Message.objects.using(source).order_by("id")[0].pk
+        self.client.like_message(first_id)
+
+        call_command(
+            "rebalance_shards", move=[[str(group_id), target]], stdout=StringIO()
+        )
+        self.assertEqual(shard_for_group(group_id), target)
+        self.assertFalse(Message.objects.using(source).exists())
+        self.assertEqual(MessageStatus.objects.using(target).count(), 1)
+
+        self.client.post_message("three", group_id)
+        messages = self.client.get_messages(group_id).json()["messages"]
+        self.assertEqual([m["text"] for m in messages], ["one", "two", "three"])
+        # ids keep growing within the group after the move
+        self.assertEqual(messages, sorted(messages, key=lambda m: m["id"]))
+        summary = self.client.get_reaction_summary(first_id).json()["summary"]
+        self.assertEqual(summary["like"], 1)
+        export = b"".join(self.client.export_messages(group_id).streaming_content)
+        self.assertEqual(len(export.splitlines()), 3)
+
+    def test_move_group_onto_shard_with_memberships(self):
+        group_ids = self.create_groups(2)
+        while len({shard_for_group(group_id) for group_id in group_ids}) < 2:
+            group_ids += self.create_groups(1)
+        group_id = group_ids[0]
+        source = shard_for_group(group_id)
+        (target,) = set(self.shards) - {source}
+        memberships = ChatGroup.members.through.objects
+        self.assertTrue(memberships.using(target).exists())
+
+        move_group(group_id, target)
+        self.assertEqual(shard_for_group(group_id), target)
+        self.assertEqual(
+            memberships.using(target).filter(chatgroup_id=group_id).count(), 1
+        )
+        self.assertEqual(self.client.post_message("hi", group_id).status_code, 201)
+
+    def test_move_group_rolls_back_on_conflict(self):
+        (group_id,) = self.create_groups(1)
+        self.client.post_message("one", group_id)
+        source = shard_for_group(group_id)
+        (target,) = set(self.shards) - {source}
+        sender = User.objects.using(source).get(username="dev")
+
+        def copy_then_write(queryset, alias, **kwargs):
+            copied = copy_rows(queryset, alias, **kwargs)
+            if queryset.model is Message:
+                # a write that slipped past the locks
+                Message.objects.using(source).create(
+                    group_id=group_id, sender=sender, text="late"
+                )
+            return copied
+
+        with mock.patch("chats.sharding.copy_rows", copy_then_write):
+            with self.assertRaises(GroupMoveConflict):
+                move_group(group_id, target)
+        self.assertEqual(shard_for_group(group_id), source)
+        self.assertFalse(Message.objects.using(target).exists())
+        self.assertEqual(Message.objects.using(source).count(), 1)
+
+
+class ConditionalGetTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        self.client = logged_in_client("dev")
+        self.client.post_message("hello", self.group.pk)
+        self.message = Message.objects.get()
+
+    def test_history_not_modified_until_new_or_edited_message(self):
+        etag = self.client.get_messages(self.group.pk)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get_messages(self.group.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            self.client.get_messages(
+                self.group.pk, if_none_match=etag, limit=1
+            ).status_code,
+            200,
+        )
+
+        self.client.edit_message(self.message.pk, "hello again")
+        response = self.client.get_messages(self.group.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.client.post_message("second", self.group.pk)
+        response = self.client.get_messages(self.group.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_history_modified_by_sender_rename(self):
+        etag = self.client.get_messages(self.group.pk)["ETag"]
+        self.user.first_name = "Dev"
+        self.user.save()
+        response = self.client.get_messages(self.group.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.user.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get_messages(self.group.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["messages"][0]["sender"], "renamed")
+
+    def test_reactions_not_modified_until_reaction_changes(self):
+        etag = self.client.get_reaction_summary(self.message.pk)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get_reaction_summary(
+                self.message.pk, if_none_match=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        self.client.like_message(self.message.pk, "heart")
+        response = self.client.get_reaction_summary(self.message.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["summary"]["heart"], 1)
+
+
+class ReactionUpsertTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(8)
+        )
+        self.ids = list(Message.objects.order_by("id").values_list("id", flat=True))
+        self.client = logged_in_client("dev")
+
+    def summary(self, pk):
+        return self.client.get_reaction_summary(pk).json()["summary"]
+
+    def test_repeated_reactions_keep_one_row(self):
+        self.assertEqual(self.client.like_message(self.ids[0], "like").status_code, 201)
+        self.assertEqual(
+            self.client.like_message(self.ids[0], "heart").status_code, 201
+        )
+        self.assertEqual(MessageStatus.objects.filter(message=self.ids[0]).count(), 1)
+        self.assertEqual(
+            self.summary(self.ids[0]), {"like": 0, "dislike": 0, "heart": 1}
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MessageStatus.objects.create(
+                message_id=self.ids[0], owner=self.user, status="like"
+            )
+
+    def test_single_reaction_statements(self):
+        self.client.get_messages(self.group.pk)
+        for status in ("like", "heart"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.like_message(self.ids[0], status)
+            self.assertEqual(response.status_code, 201)
+            statements = [
+                query["sql"]
+                for query in queries.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            ]
+            # message, counter lock, old status, upsert, counters
+            self.assertEqual(len(statements), 5, statements)
+        reaction = MessageStatus.objects.get(message=self.ids[0])
+        self.assertEqual(
+            response.json(),
+            {
+                "id": reaction.pk,
+                "message": self.ids[0],
+                "owner": self.user.pk,
+                "status": "heart",
+            },
+        )
+        self.assertEqual(
+            self.summary(self.ids[0]), {"like": 0, "dislike": 0, "heart": 1}
+        )
+
+    def test_batch_applies_in_constant_queries(self):
+        self.client.get_messages(self.group.pk)
+
+        def batch(ids, status):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.react_batch(
+                    [{"message": pk, "status": status} for pk in ids]
+                )
+            self.assertEqual(response.status_code, 200)
+            return response.json()["results"], len(queries)
+
+        results, small = batch(self.ids[:2], "like")
+        self.assertEqual(
+            results[0], {"message": self.ids[0], "status": "like", "previous": None}
+        )
+        _, large = batch(self.ids[2:], "like")
+        self.assertEqual(small, large)
+
+        results, _ = batch(self.ids[:4], "heart")
+        self.assertEqual({r["previous"] for r in results}, {"like"})
+        batch(self.ids[:1], None)
+        self.assertEqual(
+            self.summary(self.ids[0]), {"like": 0, "dislike": 0, "heart": 0}
+        )
+        self.assertEqual(
+            self.summary(self.ids[1]), {"like": 0, "dislike": 0, "heart": 1}
+        )
+        self.assertEqual(
+            self.summary(self.ids[5]), {"like": 1, "dislike": 0, "heart": 0}
+        )
+
+    def test_batch_rejects_foreign_messages(self):
+        other = mommy.make(Message)
+        response = self.client.react_batch(
+            [
+                {"message": self.ids[0], "status": "like"},
+                {"message": other.pk, "status": "like"},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MessageStatus.objects.exists())
+
+
+class EmbeddedReactionsTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.friend = make_user("dev"), make_user("friend")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user, self.friend)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(6)
+        )
+        self.ids = list(Message.objects.order_by("id").values_list("id", flat=True))
+        self.client = logged_in_client("dev")
+        friend = logged_in_client("friend")
+        self.client.like_message(self.ids[0], "heart")
+        friend.like_message(self.ids[0], "heart")
+        friend.like_message(self.ids[1], "like")
+
+    def test_history_embeds_counts_and_own_reaction(self):
+        page = self.client.get_messages(self.group.pk, reactions="true").json()
+        first, second, third = page["messages"][:3]
+        self.assertEqual(first["reactions"], {"like": 0, "dislike": 0, "heart": 2})
+        self.assertEqual(first["my_reaction"], "heart")
+        self.assertEqual(second["reactions"]["like"], 1)
+        self.assertIsNone(second["my_reaction"])
+        self.assertEqual(third["reactions"], {"like": 0, "dislike": 0, "heart": 0})
+
+    def test_one_aggregate_per_page(self):
+        self.client.get_messages(self.group.pk)
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get_messages(self.group.pk, limit=2, **{"from": 1})
+        with CaptureQueriesContext(connection) as small:
+            self.client.get_messages(self.group.pk, limit=2, reactions="true")
+        with CaptureQueriesContext(connection) as large:
+            self.client.get_messages(self.group.pk, limit=6, reactions="true")
+        self.assertEqual(len(small), len(plain) + 1)
+        self.assertEqual(len(small), len(large))
+
+
+class MessageExportTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, name="Audit", owner=self.user)
+        self.group.members.add(self.user)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(5)
+        )
+        self.client = logged_in_client("dev")
+        self.client.like_message(Message.objects.first().pk, "heart")
+
+    def assertExport(self, payload):
+        lines = [json.loads(line) for line in payload.decode().splitlines()]
+        self.assertEqual(
+            [line["text"] for line in lines][:2], ["message 0", "message 1"]
+        )
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0]["sender"], "dev")
+        self.assertEqual(lines[0]["reactions"], {"like": 0, "dislike": 0, "heart": 1})
+
+    def test_streaming_export(self):
+        response = self.client.export_messages(self.group.pk)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertExport(b"".join(response.streaming_content))
+
+        response = self.client.export_messages(self.group.pk, gzip=True)
+        self.assertExport(gzip.decompress(b"".join(response.streaming_content)))
+
+    def test_columnar_export(self):
+        response = self.client.export_messages(self.group.pk, layout="columns")
+        header, *rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            header["columns"],
+            ["id", "sender", "timestamp", "text", "like", "dislike", "heart"],
+        )
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][1:2] + rows[0][3:], ["dev", "message 0", 0, 0, 1])
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.ndjson.gz")
+            call_command("export_group_messages", self.group.pk, output=path, gzip=True)
+            with gzip.open(path) as export:
+                self.assertExport(export.read())
+
+
+class AsgiMessageExportTestCase(APITransactionTestCase):
+    # the body is read in a worker thread on its own connection
+    def setUp(self):
+        get_membership_cache().local.clear()
+        get_user_cache().clear()
+        self.user = mommy.make(User, username="dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(5)
+        )
+
+    def test_export_through_asgi(self):
+        from chat_group.asgi import application
+
+        sent = []
+
+        async def run():
+            async def receive():
+                return {"type": "http.request", "body": b""}
+
+            async def send(event):
+                sent.append(event)
+
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": f"/api/v1/chatgroups/{self.group.pk}/export/",
+                "query_string": b"",
+                "headers": [(b"authorization", f"Bearer {token}".encode())],
+            }
+            await application(scope, receive, send)
+
+        token = AccessToken.for_user(self.user)
+        async_to_sync(run)()
+        self.assertEqual(sent[0]["status"], 200)
+        lines = b"".join(event.get("body", b"") for event in sent[1:]).splitlines()
+        self.assertEqual(
+            [json.loads(line)["text"] for line in lines],
+            [f"message {i}" for i in range(5)],
+        )
+
+
+class MessageArchiveTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, name="Archive", owner=self.user)
+        self.group.members.add(self.user)
+        Message.objects.bulk_create(
+            Message(group=self.group, sender=self.user, text=f"message {i}")
+            for i in range(10)
+        )
+        self.ids = list(Message.objects.order_by("id").values_list("id", flat=True))
+        # two old days of three messages each, the rest stays hot
+        old = timezone.now() - timedelta(days=200)
+        for i, pk in enumerate(self.ids[:6]):
+            Message.objects.filter(pk=pk).update(
+                timestamp=old + timedelta(days=i // 3, minutes=i)
+            )
+        self.client = logged_in_client("dev")
+        self.client.like_message(self.ids[1], "heart")
+
+    def test_full_hot_page_skips_segments(self):
+        call_command(
+            "archive_messages", older_than_days=90, stdout=open(os.devnull, "w")
+        )
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get_messages(self.group.pk, limit=2).json()
+        self.assertEqual([m["id"] for m in page["messages"]], self.ids[8:])
+        self.assertFalse(any("payload" in query["sql"] for query in queries))
+
+    def test_history_and_export_span_tiers(self):
+        call_command(
+            "archive_messages", older_than_days=90, stdout=open(os.devnull, "w")
+        )
+        self.assertEqual(Message.objects.count(), 4)
+        self.assertEqual(MessageArchiveSegment.objects.count(), 2)
+
+        seen, params = [], {"limit": 4}
+        while True:
+            page = self.client.get_messages(self.group.pk, **params).json()
+            seen = [m["id"] for m in page["messages"]] + seen
+            if not page["has_more"]:
+                break
+            params["before"] = page["older"]
+        self.assertEqual(seen, self.ids)
+
+        page = self.client.get_messages(self.group.pk, limit=2).json()
+        page = self.client.get_messages(
+            self.group.pk, limit=2, before=page["older"]
+        ).json()
+        page = self.client.get_messages(
+            self.group.pk, limit=5, before=page["older"]
+        ).json()
+        self.assertEqual([m["id"] for m in page["messages"]], self.ids[1:6])
+        self.assertEqual(page["messages"][0]["sender"], "dev")
+        page = self.client.get_messages(
+            self.group.pk, limit=3, after=page["older"]
+        ).json()
+        self.assertEqual([m["id"] for m in page["messages"]], self.ids[2:5])
+
+        self.assertEqual(
+            self.client.get_messages(self.group.pk, **{"from": 24}).json()["messages"][
+                0
+            ]["id"],
+            self.ids[6],
+        )
+
+        page = self.client.get_messages(self.group.pk, reactions="true").json()
+        self.assertEqual(page["messages"][1]["reactions"]["heart"], 1)
+        self.assertEqual(page["messages"][1]["my_reaction"], "heart")
+
+        response = self.client.export_messages(self.group.pk)
+        lines = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([line["id"] for line in lines], self.ids)
+        self.assertEqual(lines[1]["reactions"]["heart"], 1)
+
+
+class MessageSearchTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.group, self.other_group = mommy.make(ChatGroup, _quantity=2)
+        self.group.members.add(self.user)
+        self.other_group.members.add(self.user)
+        self.client = logged_in_client("dev")
+        self.client.post_message("deploy the release today", self.group.pk)
+        self.client.post_message("release notes are ready", self.group.pk)
+        self.client.post_message("lunch?", self.group.pk)
+        self.client.post_message("release party", self.other_group.pk)
+
+    def search(self, q, **params):
+        response = self.client.search_messages(self.group.pk, q, **params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranked_and_paginated_search(self):
+        results = self.search("release")["results"]
+        self.assertEqual(
+            {result["text"] for result in results},
+            {"deploy the release today", "release notes are ready"},
+        )
+        first_page = self.search("release", limit=1)
+        self.assertTrue(first_page["has_more"])
+        second_page = self.search("release", limit=1, page=2)
+        self.assertFalse(second_page["has_more"])
+        self.assertEqual(
+            [first_page["results"][0]["id"], second_page["results"][0]["id"]],
+            [result["id"] for result in results],
+        )
+        # search syntax in user input is treated as plain terms
+        self.assertEqual(self.search('release" OR "lunch')["results"], [])
+
+    def test_index_follows_edits(self):
+        message = Message.objects.get(text="lunch?")
+        response = self.client.edit_message(message.pk, "dinner after the release?")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["text"], "dinner after the release?")
+        self.assertEqual(self.search("lunch")["results"], [])
+        self.assertEqual(len(self.search("release")["results"]), 3)
+
+
+class BenchmarkTestCase(ChatAPITestCase):
+    def test_report(self):
+        dataset = benchmark.seed(
+            users=4, groups=2, members_per_group=3, messages=20, reactions=5
+        )
+        report = benchmark.run(
+            dataset,
+            concurrency=1,
+            iterations=20,
+            mix={"post": 1, "read": 1, "react": 1, "membership": 1},
+        )
+        endpoints = report["endpoints"]
+        # membership steps add and remove, timed apart
+        self.assertEqual(
+            endpoints["membership.add"]["requests"],
+            endpoints["membership.remove"]["requests"],
+        )
+        self.assertEqual(
+            report["requests"], 20 + endpoints["membership.remove"]["requests"]
+        )
+        for endpoint in endpoints.values():
+            self.assertEqual(endpoint["errors"], 0)
+            self.assertLessEqual(
+                endpoint["latency_ms"]["p50"], endpoint["latency_ms"]["p99"]
+            )
+            self.assertGreater(endpoint["sql_queries_per_request"], 0)
+
+    def test_seed_is_idempotent(self):
+        options = dict(users=4, groups=2, members_per_group=3, messages=20, reactions=5)
+        dataset = benchmark.seed(**options)
+        counts = [
+            model.objects.count() for model in (User, ChatGroup, Message, MessageStatus)
+        ]
+        self.assertEqual(benchmark.seed(**options), dataset)
+        self.assertEqual(
+            [
+                model.objects.count()
+                for model in (User, ChatGroup, Message, MessageStatus)
+            ],
+            counts,
+        )
+        self.assertEqual(counts[2], 20)
+
+    def test_serialization_report(self):
+        report = benchmark.serialization_benchmark(messages=100, repeat=1)
+        results = report["results"]
+        self.assertEqual(
+            results["drf_json_dict_rows"]["bytes"],
+            results["fast_json_dict_rows"]["bytes"],
+        )
+        self.assertLess(
+            results["fast_json_columns"]["bytes"],
+            results["drf_json_dict_rows"]["bytes"],
+        )
+
+
+THROTTLE_RATES = {
+    "messages": {"user": "2/min", "ip": "3/min"},
+    "login": {"user": "2/min", "ip": "60/min"},
+}
+
+
+@override_settings(CHAT_THROTTLE={**settings.CHAT_THROTTLE, "RATES": THROTTLE_RATES})
+class ThrottlingTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = mommy.make(ChatGroup)
+        self.clients = []
+        for username in ("dev", "other"):
+            self.group.members.add(make_user(username))
+            self.clients.append(logged_in_client(username))
+
+    def test_user_and_address_budgets(self):
+        dev, other = self.clients
+        self.assertEqual(dev.post_message("1", self.group.pk).status_code, 201)
+        self.assertEqual(dev.post_message("2", self.group.pk).status_code, 201)
+        response = dev.post_message("3", self.group.pk)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response["Retry-After"]), 30)
+        # reads and other scopes are not throttled
+        self.assertEqual(dev.get_messages(self.group.pk).status_code, 200)
+        self.assertEqual(dev.like_message(Message.objects.first().pk).status_code, 201)
+        # the address budget of three posts is shared by both users
+        self.assertEqual(other.post_message("4", self.group.pk).status_code, 201)
+        self.assertEqual(other.post_message("5", self.group.pk).status_code, 429)
+        self.assertEqual(Message.objects.count(), 3)
+
+    def test_login_budget_per_username(self):
+        # setUp logged in once per user
+        client = ChatTestApiClient("dev", "wrong")
+        self.assertEqual(
+            client.client.post(
+                "/api/v1/login/", {"username": "dev", "password": "wrong"}
+            ).status_code,
+            401,
+        )
+        response = client.client.post(
+            "/api/v1/login/", {"username": "dev", "password": "dev"}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        # attempts from one address do not lock the name out elsewhere
+        response = client.client.post(
+            "/api/v1/login/",
+            {"username": "dev", "password": "dev"},
+            REMOTE_ADDR="10.0.0.2",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_shared_store(self):
+        server = LocalRedisBuckets()
+        nodes = [RedisBucketStore(client=server) for _ in range(2)]
+        self.assertEqual(nodes[0].consume("messages:user:1", 1.0, 2), 0)
+        self.assertEqual(nodes[1].consume("messages:user:1", 1.0, 2), 0)
+        self.assertGreater(nodes[0].consume("messages:user:1", 1.0, 2), 0)
+        self.assertEqual(nodes[1].consume("messages:user:2", 1.0, 2), 0)
+
+
+class MetricsTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.user = make_user("dev")
+        self.group = mommy.make(ChatGroup, owner=self.user)
+        self.group.members.add(self.user)
+        self.client = logged_in_client("dev")
+
+    def metrics(self):
+        response = self.client.client.get("/metrics")
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_per_route_metrics(self):
+        self.client.post_message("hi", self.group.pk)
+        page = self.client.get_messages(self.group.pk)
+        labels = 'route="chatgroups-messages",method="GET",status="2xx"'
+        samples = self.metrics()
+        self.assertEqual(samples[f"http_requests_total{{{labels}}}"], 1)
+        self.assertEqual(
+            samples[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 1
+        )
+        self.assertGreater(samples[f"http_request_sql_queries_total{{{labels}}}"], 0)
+        self.assertEqual(
+            samples[f"http_response_bytes_total{{{labels}}}"], len(page.content)
+        )
+        self.assertEqual(
+            samples[
+                'http_requests_total{route="messages-list",method="POST",status="2xx"}'
+            ],
+            1,
+        )
+
+
+class UnreadCountTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        self.quiet, self.busy, self.other = mommy.make(ChatGroup, _quantity=3)
+        self.quiet.members.add(self.user)
+        self.busy.members.add(self.user)
+        peer = mommy.make(User, username="peer")
+        Message.objects.bulk_create(
+            Message(group=self.quiet, sender=peer, text=f"quiet {i}") for i in range(5)
+        )
+        Message.objects.bulk_create(
+            Message(group=self.busy, sender=peer, text=f"busy {i}") for i in range(150)
+        )
+        # the caller's own messages are never unread
+        mommy.make(Message, group=self.quiet, sender=self.user)
+        self.client = logged_in_client("dev")
+
+    def test_unread_summary(self):
+        self.client.get_chat_groups()  # warm the authenticated user cache
+        with self.assertNumQueries(1):
+            response = self.client.get_unread()
+        self.assertEqual(
+            response.json(),
+            {
+                "groups": [
+                    {"group": self.quiet.pk, "unread": 5, "display": "5"},
+                    {"group": self.busy.pk, "unread": 99, "display": "99+"},
+                ]
+            },
+        )
+
+        quiet_ids = list(
+            Message.objects.filter(group=self.quiet)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        response = self.client.mark_read(self.quiet.pk, quiet_ids[2])
+        self.assertEqual(response.json()["last_read_message_id"], quiet_ids[2])
+        # moving the marker backwards is ignored
+        response = self.client.mark_read(self.quiet.pk, quiet_ids[0])
+        self.assertEqual(response.json()["last_read_message_id"], quiet_ids[2])
+        unread = self.client.get_unread().json()["groups"]
+        self.assertEqual(
+            unread[0], {"group": self.quiet.pk, "unread": 2, "display": "2"}
+        )
+
+    def test_unread_requires_authentication(self):
+        self.client.logout()
+        self.client.client.credentials()
+        self.assertEqual(self.client.get_unread().status_code, 401)
+
+    def test_mark_read_requires_group_message(self):
+        other_message = mommy.make(Message, group=self.other, sender=self.user)
+        response = self.client.mark_read(self.quiet.pk, other_message.pk)
+        self.assertEqual(response.status_code, 400)
+
+
+class GroupSummaryTestCase(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("dev")
+        User.objects.bulk_create(User(username=f"member{i}") for i in range(25))
+        members = list(User.objects.filter(username__startswith="member"))
+        self.groups = mommy.make(ChatGroup, owner=self.user, _quantity=3)
+        for group in self.groups:
+            group.members.add(self.user, *members)
+        mommy.make(Message, group=self.groups[0], sender=self.user, text="x" * 300)
+        self.client = logged_in_client("dev")
+
+    def test_list_is_a_single_query(self):
+        self.client.get_chat_groups()  # warm the authenticated user cache
+        with self.assertNumQueries(1):
+            response = self.client.get_chat_groups()
+        groups = response.json()
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(groups[0]["member_count"], 26)
+        self.assertEqual(len(groups[0]["last_message"]["preview"]), 100)
+        self.assertIsNone(groups[1]["last_message"])
+        self.assertNotIn("members", groups[0])
+
+    def test_paginated_members(self):
+        first = self.client.get_members(self.groups[0].pk, limit=20).json()
+        self.assertEqual(len(first["members"]), 20)
+        second = self.client.get_members(
+            self.groups[0].pk, limit=20, after=first["next"]
+        ).json()
+        self.assertEqual(len(second["members"]), 6)
+        self.assertIsNone(second["next"])
+        usernames = {m["username"] for m in first["members"] + second["members"]}
+        self.assertEqual(len(usernames), 26)
@@ -0,0 +1,242 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.dispatch import receiver
+
+from chats.models import Message
+from chats.realtime import message_event, publish_group_event
+from chats.sharding import partition, shard_for_group, use_shard
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MessageWriteBuffer:
+    """Bounded queue of validated messages written by one background thread.
+
+    The writer collects up to ``batch_size`` messages or whatever arrived
+    within ``flush_interval`` seconds of the first one and inserts them with
+    one ``bulk_create`` in one transaction, trading a little latency for one
+    commit per batch instead of one per request. ``submit`` blocks for at
+    most ``enqueue_timeout`` seconds on a full queue and then raises
+    ``QueueFull``.
+
+    A failing batch is retried ``retries`` times and then written row by
+    row, rows that still fail are logged and kept in ``dead_letters``.
+    """
+
+    def __init__(
+        self,
+        max_queue=10000,
+        batch_size=500,
+        flush_interval=0.05,
+        enqueue_timeout=0.1,
+        retries=2,
+        retry_delay=0.1,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.written = 0
+        self.failed = 0
+        # (provisional id, sender id, sender username, group id, text)
+        self.dead_letters = deque(maxlen=max_queue)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._stopped = False
+
+    def start(self):
+        with self._lock:
+            if self._writer is None and not self._stopped:
+                self._writer = threading.Thread(
+                    target=self._run, name="chat-write-behind", daemon=True
+                )
+                self._writer.start()
+
+    def submit(self, sender, group_id, text):
+        """Queue a message and return its provisional id."""
+        if self._stopped:
+            raise QueueFull("The write buffer is shut down.")
+        provisional_id = uuid.uuid4().hex
+        item = (provisional_id, sender.pk, sender.username, group_id, text)
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise QueueFull("The write buffer is full.")
+        return provisional_id
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=None):
+        """Stop accepting messages, write everything queued and wait for the
+        writer to exit."""
+        with self._lock:
+            self._stopped = True
+            writer = self._writer
+        if writer is None:
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._write(batch)
+            # drain whatever was queued before the stop marker was seen
+            batch = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start : start + self.batch_size])
+        finally:
+            connections.close_all()
+
+    def _write(self, batch):
+        for alias, items in partition(
+            batch, lambda item: shard_for_group(item[3])
+        ).items():
+            with use_shard(alias):
+                self._write_shard(items)
+
+    def _write_shard(self, batch):
+        alias = router.db_for_write(Message)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * attempt)
+            try:
+                self._insert(batch, alias)
+            except Exception:
+                logger.warning(
+                    "Failed to write %d buffered messages (attempt %d)",
+                    len(batch),
+                    attempt + 1,
+                    exc_info=True,
+                )
+                connections.close_all()
+            else:
+                self.written += len(batch)
+                return
+        # isolate the rows that keep failing instead of dropping the batch
+        for item in batch:
+            try:
+                self._insert([item], alias)
+            except Exception:
+                logger.exception(
+                    "Dead-lettered buffered message %s to group %s: %r",
+                    item[0],
+                    item[3],
+                    item[4],
+                )
+                self.failed += 1
+                self.dead_letters.append(item)
+                connections.close_all()
+            else:
+                self.written += 1
+
+    def _insert(self, batch, alias):
+        messages = [
+            Message(sender_id=sender_id, group_id=group_id, text=text)
+            for _, sender_id, _, group_id, text in batch
+        ]
+        with transaction.atomic(using=alias):
+            Message.objects.using(alias).bulk_create(messages)
+            self._publish(batch, messages, alias)
+
+    def _publish(self, batch, messages, alias):
+        if all(message.pk for message in messages):
+            for (provisional_id, _, username, group_id, _), message in zip(
+                batch, messages
+            ):
+                message.sender = User(pk=message.sender_id, username=username)
+                event = message_event(message)
+                event["message"]["provisional_id"] = provisional_id
+                publish_group_event(group_id, event, using=alias)
+            return
+        # backends without RETURNING leave the ids unset, clients re-read
+        for group_id, count in Counter(item[3] for item in batch).items():
+            publish_group_event(
+                group_id, {"type": "messages.imported", "count": count}, using=alias
+            )
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+
+def write_behind_enabled():
+    return settings.CHAT_WRITE_BEHIND.get("ENABLED", False)
+
+
+def get_write_buffer():
+    global _write_buffer
+    if _write_buffer is None:
+        with _write_buffer_lock:
+            if _write_buffer is None:
+                config = settings.CHAT_WRITE_BEHIND
+                _write_buffer = MessageWriteBuffer(
+                    max_queue=config.get("MAX_QUEUE", 10000),
+                    batch_size=config.get("BATCH_SIZE", 500),
+                    flush_interval=config.get("FLUSH_INTERVAL_MS", 50) / 1000,
+                    enqueue_timeout=config.get("ENQUEUE_TIMEOUT_MS", 100) / 1000,
+                    retries=config.get("RETRIES", 2),
+                    retry_delay=config.get("RETRY_DELAY_MS", 100) / 1000,
+                )
+                _write_buffer.start()
+    return _write_buffer
+
+
+@atexit.register
+def shutdown_write_buffer():
+    if _write_buffer is not None:
+        _write_buffer.stop()
+
+
+@receiver(setting_changed)
+def reset_write_buffer(*, setting, **kwargs):
+    global _write_buffer
+    if setting == "CHAT_WRITE_BEHIND":
+        shutdown_write_buffer()
+        _write_buffer = None
@@ -20,5 +20,10 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=["setuptools", "django"],
-    extras_require={"docs": ["Sphinx"], "tests": ["django-pytest", "pytest"]},
+    extras_require={
+        "docs": ["Sphinx"],
+        "tests": ["django-pytest", "pytest"],
+        "redis": ["redis"],
+        "fast": ["orjson", "msgpack"],
+    },
 )